@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for grimace.  The core suite is run, and compared with a
+saved baseline, by python -m benchmarks (see benchmarks/__main__.py).
+The feature benchmarks may each be run on their own, e.g.
+python -m benchmarks.lexer
+"""
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run the core benchmarks and optionally compare them with a saved
+baseline.
+
+    python -m benchmarks                          # print results
+    python -m benchmarks --json results.json      # also write them
+    python -m benchmarks --save-baseline base.json
+    python -m benchmarks --baseline base.json     # exit 1 on regression
+
+All metrics are smaller-is-better.  A metric regresses if it exceeds
+its baseline value by more than the tolerance (a fraction, default 0.25).
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import argparse
+import json
+import platform
+import sys
+from . import core
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns:
+        list: (name, baseline value, current value) for each metric that
+            regressed by more than tolerance
+    """
+    regressions = []
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if value is None or base is None:
+            continue
+        if value > base * (1 + tolerance):
+            regressions.append((name, base, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--save-baseline',
+                        help='write the results as a baseline file')
+    parser.add_argument('--baseline', help='compare with this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = core.run()
+    document = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'results': results,
+    }
+
+    for name, value in sorted(results.items()):
+        print("%-32s %14s" % (
+            name, 'n/a' if value is None else '%.2f' % value))
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(document, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for name, base, value in regressions:
+            print("REGRESSION %s: %.2f -> %.2f" % (name, base, value))
+        if regressions:
+            return 1
+        print("No regressions against %s" % args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
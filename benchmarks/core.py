@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the core RE operations: fluent construction, string
+generation, compilation with cold and warm caches, matching throughput
+against an equivalent hand-written regexp, and memory per RE.
+
+Every timing is reported in microseconds per operation, and memory in
+bytes, so that smaller is always better.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import gc
+import re
+import timeit
+from grimace import RE, PatternCache
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+# The hand-written equivalent of phone_number()
+PHONE_PATTERN = r"^\(\d{3,3}\)\-{1,1}\d{3,3}\-{1,1}\d{4,4}$"
+
+LINES = ["(123)-456-7890", "(12)-456-7890", "call (555)-123-4567",
+         "(999)-000-1111"] * 2500
+
+
+def phone_number():
+    """
+    Returns:
+        RE: a short fluent chain, as in the README examples
+    """
+    return (RE().start
+            .literal('(').followed_by.exactly(3).digits().then.literal(')')
+            .then.one().literal("-").then.exactly(3).digits()
+            .then.one().dash().followed_by.exactly(4).digits().then.end)
+
+
+def long_chain(length):
+    """
+    Returns:
+        RE: a chain of length fluent steps
+    """
+    r = RE()
+    for i in range(length):
+        r = r.one_or_more.digit if i % 2 else r.literal("x")
+    return r
+
+
+def _per_call(function, number, repeat=3):
+    """
+    Returns:
+        float: the best time for one call of function, in microseconds
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) \
+        * 1e6 / number
+
+
+def _bytes_per_re(build, count=1000):
+    """
+    Returns:
+        float: the memory held per RE, in bytes, when count REs built
+            by build are kept alive, or None if tracemalloc is not
+            available
+    """
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = [build() for _ in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return (after - before) / count
+
+
+def construction():
+    return {
+        'construct_short_us': _per_call(phone_number, 2000),
+        'construct_long_1000_us': _per_call(lambda: long_chain(1000), 20),
+        'construct_long_10000_us': _per_call(lambda: long_chain(10000), 2),
+    }
+
+
+def stringification():
+    # Each call builds a fresh RE, so the remembered string is not used;
+    # the construction cost is subtracted.
+    construct = _per_call(phone_number, 2000)
+    long_construct = _per_call(lambda: long_chain(10000), 2)
+    return {
+        'as_string_short_us': max(0.0, _per_call(
+            lambda: phone_number().as_string(), 2000) - construct),
+        'as_string_long_10000_us': max(0.0, _per_call(
+            lambda: long_chain(10000).as_string(), 2) - long_construct),
+    }
+
+
+def compilation():
+    saved = RE.cache
+    try:
+        RE.cache = PatternCache()
+        r = phone_number()
+        pattern = r.as_string()
+
+        def cold():
+            RE.cache.clear()
+            re.purge()
+            return phone_number().as_re()
+
+        def shared():
+            # A new RE each time, so only the shared cache can help
+            return RE(r).as_re()
+
+        return {
+            'as_re_cold_us': _per_call(cold, 200),
+            'as_re_shared_cache_us': _per_call(shared, 2000),
+            'as_re_warm_us': _per_call(r.as_re, 20000),
+            're_compile_cold_us': _per_call(
+                lambda: (re.purge(), re.compile(pattern)), 200),
+        }
+    finally:
+        RE.cache = saved
+
+
+def matching():
+    grimace_search = phone_number().as_re().search
+    hand_search = re.compile(PHONE_PATTERN).search
+    r = phone_number()
+    assert [bool(m) for m in map(grimace_search, LINES)] == \
+        [bool(m) for m in map(hand_search, LINES)]
+    return {
+        'match_lines_grimace_us': _per_call(
+            lambda: [m for m in map(grimace_search, LINES) if m], 10),
+        'match_lines_re_us': _per_call(
+            lambda: [m for m in map(hand_search, LINES) if m], 10),
+        'match_lines_filter_many_us': _per_call(
+            lambda: list(r.filter_many(LINES)), 10),
+    }
+
+
+def memory():
+    return {
+        'memory_short_re_bytes': _bytes_per_re(phone_number),
+        'memory_step_bytes': _bytes_per_re(lambda: RE().digit, 10000),
+    }
+
+
+SUITES = (construction, stringification, compilation, matching, memory)
+
+
+def run():
+    """
+    Returns:
+        dict: every metric from every suite
+    """
+    results = {}
+    for suite in SUITES:
+        results.update(suite())
+    return results
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""
+Show the gain from rejecting inputs shorter than RE.min_length() before
+calling the regexp engine, for a batch of mostly short lines.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import timeit
+from grimace import RE
+
+PATTERN = (RE().literal("request ").exactly(8).alphanumerics
+           .literal(" took ").between(1, 6).digits.literal("ms"))
+
+LINES = (["ok", "GET /", "200 OK", "request x"] * 2500 +
+         ["request a1b2c3d4 took 1234ms"] * 100)
+
+
+def main(number=20):
+    search = PATTERN.as_re().search
+    minimum = PATTERN.min_length()
+
+    def plain():
+        return [line for line in LINES if search(line)]
+
+    def prefiltered():
+        return [line for line in LINES
+                if len(line) >= minimum and search(line)]
+
+    assert plain() == prefiltered()
+    results = {
+        'plain': min(timeit.repeat(plain, number=number, repeat=3)),
+        'min_length': min(timeit.repeat(prefiltered, number=number,
+                                        repeat=3)),
+    }
+    for name, seconds in sorted(results.items()):
+        print("%-10s %8.2f ms per run" % (name, seconds * 1000 / number))
+    print("speedup    %8.2fx" % (results['plain'] / results['min_length']))
+    return results
+
+
+if __name__ == '__main__':
+    main()
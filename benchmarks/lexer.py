@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare the Lexer's single master-pattern scan with a naive tokenizer
+that tries each token pattern in turn at each position.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import timeit
+from grimace import RE, Lexer
+
+TOKENS = [
+    ('timestamp', RE().exactly(4).digits.dash.exactly(2).digits
+                  .dash.exactly(2).digits),
+    ('level', RE().any_re('DEBUG', 'INFO', 'WARNING', 'ERROR')),
+    ('number', RE().one_or_more.digit),
+    ('name', RE().identifier),
+    ('punctuation', RE().any_of('[]():=,.')),
+    ('space', RE().one_or_more.whitespace),
+]
+
+LINE = "2017-06-01 INFO [worker.3] request(id=1234, user=alice) done. "
+TEXT = LINE * 200
+
+
+def naive_tokenize(patterns, text):
+    """
+    Try each compiled pattern in turn at each position
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        for kind, pattern in patterns:
+            match = pattern.match(text, position)
+            if match:
+                if kind != 'space':
+                    tokens.append((kind, match.group(), position))
+                position = match.end()
+                break
+        else:
+            raise ValueError("No token at %d" % position)
+    return tokens
+
+
+def main(number=20):
+    lexer = Lexer(TOKENS, skip=['space'])
+    patterns = [(kind, r.as_re()) for kind, r in TOKENS]
+    assert [tuple(t) for t in lexer(TEXT)] == naive_tokenize(patterns, TEXT)
+
+    results = {
+        'lexer': min(timeit.repeat(lambda: lexer(TEXT),
+                                   number=number, repeat=3)),
+        'naive': min(timeit.repeat(lambda: naive_tokenize(patterns, TEXT),
+                                   number=number, repeat=3)),
+    }
+    for name, seconds in sorted(results.items()):
+        print("%-8s %8.2f ms per run" % (name, seconds * 1000 / number))
+    print("speedup  %8.2fx" % (results['naive'] / results['lexer']))
+    return results
+
+
+if __name__ == '__main__':
+    main()
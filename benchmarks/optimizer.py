@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare generated patterns with their optimized() forms, for pattern
+length, compile time and match speed.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import re
+import timeit
+from grimace import RE
+from .core import phone_number
+
+
+def generated():
+    """
+    Returns:
+        dict: name to RE, for patterns typical of generated code
+    """
+    serial = RE().start
+    for _ in range(3):
+        serial = serial.a.literal('-').digit.digit.digit.digit
+    return {
+        'phone': phone_number(),
+        'serial': serial.end,
+        'hosts': RE().start.group.any_re(*(
+            RE().literal('server-%s.example.com' % name)
+            for name in ('alpha', 'beta', 'gamma', 'delta')
+        )).end_group.end,
+        'padded': RE().start.literal('0000000000').one_or_more.digit.end,
+    }
+
+
+def _microseconds(function, number):
+    return min(timeit.repeat(function, number=number, repeat=3)) \
+        * 1e6 / number
+
+
+def main(number=20000):
+    lines = ["(123)-456-7890", "-1234-5678-9012", "0000000000123",
+             "server-gamma.example.com", "no match here"] * 200
+
+    results = {}
+    for name, r in sorted(generated().items()):
+        plain = r.as_string()
+        optimized = r.optimized().as_string()
+        plain_re, optimized_re = re.compile(plain), re.compile(optimized)
+        assert [plain_re.match(s) and plain_re.match(s).span()
+                for s in lines] == \
+            [optimized_re.match(s) and optimized_re.match(s).span()
+             for s in lines]
+
+        row = results[name] = {}
+        for label, pattern, compiled in (('plain', plain, plain_re),
+                                         ('optimized', optimized,
+                                          optimized_re)):
+            row[label + '_length'] = len(pattern)
+            row[label + '_compile_us'] = _microseconds(
+                lambda: (re.purge(), re.compile(pattern)), number // 20)
+            row[label + '_match_us'] = _microseconds(
+                lambda: [compiled.match(s) for s in lines], number // 200)
+        print("%-7s length %3d -> %3d  compile %7.1f -> %7.1f us  "
+              "match %7.1f -> %7.1f us" % (
+                  name, row['plain_length'], row['optimized_length'],
+                  row['plain_compile_us'], row['optimized_compile_us'],
+                  row['plain_match_us'], row['optimized_match_us']))
+    return results
+
+
+if __name__ == '__main__':
+    main()
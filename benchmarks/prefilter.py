@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compare searching log lines with the plain compiled regexp against the
+literal-prefiltered matcher from RE.prefiltered().
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import timeit
+from grimace import RE
+
+PATTERN = (RE().literal("ERROR").one_or_more.whitespace
+           .named_group("code").exactly(4).digits.end_group
+           .zero_or_more.any_character.literal("timeout"))
+
+LINES = ([
+    "2017-06-01 INFO worker 3 handled request 1234 in 15ms",
+    "2017-06-01 DEBUG cache hit for key user:alice",
+    "2017-06-01 WARNING slow response 2048ms from upstream",
+] * 3000 + ["2017-06-01 ERROR 5031 upstream timeout after 30s"] * 30)
+
+
+def main(number=10):
+    search = PATTERN.as_re().search
+    matcher = PATTERN.prefiltered()
+
+    def plain():
+        return [m for m in map(search, LINES) if m]
+
+    def prefiltered():
+        return list(matcher.filter(LINES))
+
+    assert len(plain()) == len(prefiltered())
+    results = {
+        'plain': min(timeit.repeat(plain, number=number, repeat=3)),
+        'prefiltered': min(timeit.repeat(prefiltered, number=number,
+                                         repeat=3)),
+    }
+    for name, seconds in sorted(results.items()):
+        print("%-12s %8.2f ms per run" % (name, seconds * 1000 / number))
+    print("speedup      %8.2fx" % (results['plain'] / results['prefiltered']))
+    print("selectivity  %8.4f" % matcher.stats()['selectivity'])
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -14,4 +14,9 @@ from __future__ import (absolute_import, division, print_function,
 # TODO - combining REs
 
 from .extender import Extender
-from .elements import RE, FormatError
+from .elements import RE, CharClass, FormatError, BacktrackingError
+from .cache import PatternCache
+from .builder import REBuilder
+from .reset import RESet, RESetMatch
+from .lexer import Lexer, LexError, Token
+from .stream import StreamMatcher, StreamMatch
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Match an RE against the items of an asyncio stream without blocking the
+event loop.  Requires Python 3.6 or later; the rest of grimace does not
+import this module, so it remains usable on older Pythons.
+
+Items are matched as they arrive, so nothing is read ahead of the
+consumer and backpressure is preserved.  Control is returned to the
+event loop after every batch_size items, and any item of at least
+executor_threshold characters (or bytes) is matched in an executor
+rather than on the event loop.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import asyncio
+
+# Defaults for the number of items matched between yields to the event
+# loop, and the item size above which matching moves to an executor
+BATCH_SIZE = 256
+EXECUTOR_THRESHOLD = 256 * 1024
+
+
+def _compiler(r, flags):
+    """
+    Returns:
+        callable: returns the compiled RE for an item, as a bytes regexp
+            if the item is bytes
+    """
+    def compiled(item):
+        if isinstance(item, (bytes, bytearray)):
+            return r.as_bytes_re(flags)
+        return r.as_re(flags)
+    return compiled
+
+
+async def _matches(source, compiled, match, batch_size, executor_threshold,
+                   executor):
+    """
+    Yields:
+        the result of match(compiled regexp, item) for each item of
+            source
+    """
+    loop = asyncio.get_event_loop()
+    count = 0
+    async for item in source:
+        if len(item) >= executor_threshold:
+            yield await loop.run_in_executor(executor, match,
+                                             compiled(item), item)
+            continue
+
+        yield match(compiled(item), item)
+        count += 1
+        if count >= batch_size:
+            count = 0
+            await asyncio.sleep(0)
+
+
+def _search(compiled, item):
+    return compiled.search(item)
+
+
+def _match(compiled, item):
+    return compiled.match(item)
+
+
+def _finditer(compiled, item):
+    return list(compiled.finditer(item))
+
+
+async def amatch_stream(r, reader, flags=0, search=True,
+                        batch_size=BATCH_SIZE,
+                        executor_threshold=EXECUTOR_THRESHOLD,
+                        executor=None):
+    """
+    Match r against each item (for a StreamReader, each line) of an async
+    iterable.
+
+    Args:
+        r (RE): the RE to match
+        reader: an asyncio.StreamReader, or any async iterable of str or
+            bytes items
+        flags (int): flags passed to as_re() or as_bytes_re()
+        search (bool): if True (the default), search each item; if
+            False, match at the start of each item only
+        batch_size (int): the number of items to match before returning
+            control to the event loop
+        executor_threshold (int): items at least this long are matched in
+            the executor
+        executor: a concurrent.futures executor, or None for the event
+            loop's default executor
+    Yields:
+        match objects, for the items that match
+    """
+    results = _matches(reader, _compiler(r, flags),
+                       _search if search else _match, batch_size,
+                       executor_threshold, executor)
+    async for result in results:
+        if result is not None:
+            yield result
+
+
+async def afinditer(r, source, flags=0, batch_size=BATCH_SIZE,
+                    executor_threshold=EXECUTOR_THRESHOLD, executor=None):
+    """
+    Find every non-overlapping match of r in each item of an async
+    iterable.  Matches do not span items.
+
+    Args:
+        r (RE): the RE to match
+        source: an asyncio.StreamReader, or any async iterable of str or
+            bytes items
+        flags, batch_size, executor_threshold, executor: as for
+            amatch_stream()
+    Yields:
+        match objects, in order
+    """
+    results = _matches(source, _compiler(r, flags), _finditer, batch_size,
+                       executor_threshold, executor)
+    async for found in results:
+        for match in found:
+            yield match
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static analysis of regexp strings generated by RE objects.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from nine import chr, range
+
+try:
+    # Python 3.11 and later
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+def width(pattern, flags=0):
+    """
+    Compute the bounds on the length of text that pattern can match,
+    using the re module's own parser, so that every construct (including
+    strings added with regex()) is accounted for.  Lookaround assertions
+    do not count towards the width.
+
+    Args:
+        pattern (str or bytes): the regexp string
+        flags (int): flags the pattern will be compiled with
+    Returns:
+        tuple: (minimum, maximum), where maximum is None if the pattern
+            can match text of unbounded length
+    """
+    minimum, maximum = sre_parse.parse(pattern, flags).getwidth()
+    # Depending on the Python version, an unbounded width is reported
+    # as MAXREPEAT or as one less than it.
+    if maximum >= sre_parse.MAXREPEAT - 1:
+        maximum = None
+    return minimum, maximum
+
+
+def _lookaround_widths(subpattern, widths):
+    """
+    Add the maximum widths of the lookbehind and lookahead assertions in
+    subpattern (at any depth) to widths, a two-item list.  An unbounded
+    assertion makes the total None.
+    """
+    for op, av in subpattern:
+        if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            direction, body = av
+            index = 0 if direction < 0 else 1
+            maximum = body.getwidth()[1]
+            if widths[index] is not None:
+                widths[index] = None \
+                    if maximum >= sre_parse.MAXREPEAT - 1 \
+                    else widths[index] + maximum
+            _lookaround_widths(body, widths)
+        elif op is sre_parse.BRANCH:
+            for alternative in av[1]:
+                _lookaround_widths(alternative, widths)
+        elif op is sre_parse.SUBPATTERN:
+            _lookaround_widths(av[-1], widths)
+        elif op in _REPEATS:
+            _lookaround_widths(av[2], widths)
+        elif op is _ATOMIC_GROUP:
+            _lookaround_widths(av, widths)
+
+
+def lookaround_widths(pattern, flags=0):
+    """
+    Compute bounds on how far lookbehind and lookahead assertions in
+    pattern can look outside the text that a match consumes.  The
+    bounds are the sums of the assertions' maximum widths, which is
+    generous but safe.
+
+    Args:
+        pattern (str or bytes): the regexp string
+        flags (int): flags the pattern will be compiled with
+    Returns:
+        tuple: (behind, ahead), either of which is None if unbounded
+    """
+    widths = [0, 0]
+    _lookaround_widths(sre_parse.parse(pattern, flags), widths)
+    return tuple(widths)
+
+
+# Parser opcodes.  The possessive and atomic forms only exist in Python
+# 3.11 and later.
+_REPEATS = tuple(
+    op for op in (
+        sre_parse.MAX_REPEAT,
+        sre_parse.MIN_REPEAT,
+        getattr(sre_parse, 'POSSESSIVE_REPEAT', None),
+    ) if op is not None
+)
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+_BEGINNINGS = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING)
+
+
+def _literal_runs(subpattern, runs):
+    """
+    Append to runs each run of consecutive literal characters (as lists
+    of code points) that every match of subpattern must contain.
+    Anything inside an alternation, or inside a repeat that may occur
+    zero times, is not required and is skipped.
+    """
+    current = []
+    for op, av in subpattern:
+        if op is sre_parse.LITERAL:
+            current.append(av)
+            continue
+
+        if current:
+            runs.append(current)
+            current = []
+
+        if op is sre_parse.SUBPATTERN:
+            # av is (group, add_flags, del_flags, p) or, before Python
+            # 3.6, (group, p).  A group that turns on IGNORECASE does not
+            # require its literals exactly.
+            if len(av) < 4 or not av[1] & sre_parse.SRE_FLAG_IGNORECASE:
+                _literal_runs(av[-1], runs)
+        elif op in _REPEATS:
+            if av[0] >= 1:
+                _literal_runs(av[2], runs)
+        elif op is _ATOMIC_GROUP:
+            _literal_runs(av, runs)
+
+    if current:
+        runs.append(current)
+
+
+def required_literals(pattern, flags=0):
+    """
+    Find the literal substrings that any text matching pattern must
+    contain, and the literal prefix that it must start with if the
+    pattern is anchored at the start.
+
+    Args:
+        pattern (str or bytes): the regexp string
+        flags (int): flags the pattern will be compiled with
+    Returns:
+        tuple: (literals, prefix), where literals is a list of strings
+            (or bytes, for a bytes pattern) and prefix is a string, or
+            None if the pattern is not anchored by a literal.  Both are
+            empty if flags include IGNORECASE.
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    # The flags in effect include any set inline, such as (?i)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    if state.flags & sre_parse.SRE_FLAG_IGNORECASE:
+        return [], None
+
+    if isinstance(pattern, bytes):
+        def join(codes):
+            return bytes(bytearray(codes))
+    else:
+        def join(codes):
+            return ''.join(chr(c) for c in codes)
+
+    runs = []
+    _literal_runs(parsed, runs)
+
+    # The pattern is anchored at the start by \A, or by ^ unless '^' may
+    # also match after a newline
+    anchors = [(sre_parse.AT, sre_parse.AT_BEGINNING_STRING)]
+    if not state.flags & sre_parse.SRE_FLAG_MULTILINE:
+        anchors.append((sre_parse.AT, sre_parse.AT_BEGINNING))
+
+    prefix = None
+    items = list(parsed)
+    if items and items[0] in anchors:
+        codes = []
+        for op, av in items[1:]:
+            if op is not sre_parse.LITERAL:
+                break
+            codes.append(av)
+        if codes:
+            prefix = join(codes)
+
+    return [join(run) for run in runs], prefix
+
+
+# Backtracking analysis.
+#
+# The checks work on the sets of characters that can start each part of
+# a pattern.  Characters are represented by their code points up to 255.
+# Every character beyond 255 is represented by one of four markers,
+# according to which of the \d, \w and \s categories it belongs to, so
+# that a category and its complement never share a marker.  The sets are
+# approximate but small.  Approximation only ever makes sets larger, so
+# it can cause a spurious warning but never hide a real one.
+
+BacktrackingWarning = namedtuple('BacktrackingWarning', ('kind', 'message'))
+"""
+A pattern construct that may cause catastrophic backtracking.  kind is
+'nested_quantifier' or 'overlapping_alternatives'.
+"""
+
+# Markers for characters beyond 255
+_BEYOND_DIGIT = -1      # a decimal digit (and so a word character)
+_BEYOND_WORD = -2       # a word character that is not a digit
+_BEYOND_SPACE = -3      # a whitespace character
+_BEYOND_OTHER = -4      # anything else
+_BEYOND = frozenset([_BEYOND_DIGIT, _BEYOND_WORD, _BEYOND_SPACE,
+                     _BEYOND_OTHER])
+
+_ALL = frozenset(range(256)) | _BEYOND
+_DIGITS = frozenset(c for c in range(256) if chr(c).isdecimal()) | \
+    frozenset([_BEYOND_DIGIT])
+_SPACES = frozenset(c for c in range(256) if chr(c).isspace()) | \
+    frozenset([_BEYOND_SPACE])
+_WORD = frozenset(c for c in range(256)
+                  if chr(c).isalnum() or chr(c) == '_') | \
+    frozenset([_BEYOND_DIGIT, _BEYOND_WORD])
+_LINEBREAK = frozenset([ord('\n')])
+
+_CATEGORIES = {
+    'CATEGORY_DIGIT': _DIGITS,
+    'CATEGORY_NOT_DIGIT': _ALL - _DIGITS,
+    'CATEGORY_SPACE': _SPACES,
+    'CATEGORY_NOT_SPACE': _ALL - _SPACES,
+    'CATEGORY_WORD': _WORD,
+    'CATEGORY_NOT_WORD': _ALL - _WORD,
+    'CATEGORY_LINEBREAK': _LINEBREAK,
+    'CATEGORY_NOT_LINEBREAK': _ALL - _LINEBREAK,
+}
+
+# Repeats that give up characters to let the rest of the pattern match.
+# Possessive repeats and atomic groups never do, so they are not checked.
+_BACKTRACKING_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def _code(c):
+    """
+    Returns:
+        int: c, or the marker for its kind if it is beyond 255
+    """
+    if c < 256:
+        return c
+    character = chr(c)
+    if character.isdecimal():
+        return _BEYOND_DIGIT
+    if character.isalnum() or character == '_':
+        return _BEYOND_WORD
+    if character.isspace():
+        return _BEYOND_SPACE
+    return _BEYOND_OTHER
+
+
+def _casefold(codes):
+    """
+    Returns:
+        frozenset: codes, with both cases of every ASCII letter
+    """
+    letters = set()
+    for c in codes:
+        if 0 <= c < 128 and chr(c).isalpha():
+            letters.add(ord(chr(c).swapcase()))
+    return frozenset(codes) | frozenset(letters)
+
+
+def _charset(items):
+    """
+    Returns:
+        frozenset: the characters matched by the items of an IN op
+    """
+    codes = set()
+    # Markers that stand for only some of the characters of their kind
+    # (from a literal or range beyond 255), which a negated set must
+    # keep, since it still matches the rest of that kind
+    partial = set()
+    negate = False
+    for op, av in items:
+        if op is sre_parse.NEGATE:
+            negate = True
+        elif op is sre_parse.LITERAL:
+            code = _code(av)
+            codes.add(code)
+            if code < 0:
+                partial.add(code)
+        elif op is sre_parse.RANGE:
+            low, high = av
+            codes.update(range(low, min(high, 255) + 1))
+            if high > 255:
+                codes.update(_BEYOND)
+                partial.update(_BEYOND)
+        elif op is sre_parse.CATEGORY:
+            codes.update(_CATEGORIES.get(str(av).upper(), _ALL))
+        else:
+            codes.update(_ALL)
+    if negate:
+        return (_ALL - codes) | frozenset(partial)
+    return frozenset(codes)
+
+
+class _Analyzer(object):
+    """
+    Walks a parsed pattern, collecting BacktrackingWarnings
+    """
+
+    def __init__(self, flags):
+        self.ignorecase = flags & sre_parse.SRE_FLAG_IGNORECASE
+        self.dotall = flags & sre_parse.SRE_FLAG_DOTALL
+        self.warnings = []
+
+    def first(self, items):
+        """
+        Returns:
+            tuple: (the set of characters that can start a match of the
+                sequence of items, True if it can match the empty string)
+        """
+        codes = frozenset()
+        for item in items:
+            item_codes, nullable = self.first_of(item)
+            codes |= item_codes
+            if not nullable:
+                return codes, False
+        return codes, True
+
+    def first_of(self, item):
+        """
+        Returns:
+            tuple: as for first(), for one item
+        """
+        op, av = item
+        if op is sre_parse.LITERAL:
+            codes = frozenset([_code(av)])
+            return (_casefold(codes) if self.ignorecase else codes), False
+        if op is sre_parse.NOT_LITERAL:
+            code = _code(av)
+            return (_ALL if code < 0 else _ALL - frozenset([code])), False
+        if op is sre_parse.ANY:
+            return (_ALL if self.dotall else _ALL - _LINEBREAK), False
+        if op is sre_parse.IN:
+            codes = _charset(av)
+            return (_casefold(codes) if self.ignorecase else codes), False
+        if op is sre_parse.BRANCH:
+            codes = frozenset()
+            nullable = False
+            for alternative in av[1]:
+                alternative_codes, alternative_nullable = \
+                    self.first(alternative)
+                codes |= alternative_codes
+                nullable = nullable or alternative_nullable
+            return codes, nullable
+        if op is sre_parse.SUBPATTERN:
+            return self.first(av[-1])
+        if op is _ATOMIC_GROUP:
+            return self.first(av)
+        if op in _REPEATS:
+            codes, nullable = self.first(av[2])
+            return codes, nullable or av[0] == 0
+        if op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return frozenset(), True
+        # Backreferences and conditionals could match anything
+        return _ALL, True
+
+    def scan(self, items, follow, in_loop):
+        """
+        Check a sequence of items.
+
+        Args:
+            items (list): the items
+            follow (frozenset): the characters that can come after the
+                sequence, within the innermost enclosing loop (including
+                the start of that loop's next iteration)
+            in_loop (bool): True if the sequence is inside a backtracking
+                repeat that may match more than once
+        """
+        items = list(items)
+        for i, (op, av) in enumerate(items):
+            rest, rest_nullable = self.first(items[i + 1:])
+            item_follow = rest | follow if rest_nullable else rest
+
+            if op in _BACKTRACKING_REPEATS:
+                minimum, maximum, body = av
+                if maximum <= 1:
+                    self.scan(body, item_follow, in_loop)
+                    continue
+
+                body_first, _ = self.first(body)
+                if in_loop and minimum != maximum and \
+                        body_first & item_follow:
+                    # The inner repeat can hand characters to whatever
+                    # follows it in the outer loop, including the outer
+                    # loop's next iteration, so a string can be split
+                    # between the two in many ways.
+                    self.warnings.append(BacktrackingWarning(
+                        'nested_quantifier',
+                        'A repeat of %s to %s is inside another repeat, and '
+                        'what follows it can match the same characters' % (
+                            minimum,
+                            'unlimited' if maximum >= sre_parse.MAXREPEAT - 1
+                            else maximum
+                        )
+                    ))
+                self.scan(body, body_first | item_follow, True)
+
+            elif op is sre_parse.BRANCH:
+                alternatives = av[1]
+                if in_loop:
+                    # An alternative that can match nothing lets what
+                    # follows the branch start there instead.  This also
+                    # catches (a|aa)*, which the parser factors into
+                    # a(?:|a)*.
+                    firsts = []
+                    for alternative in alternatives:
+                        codes, nullable = self.first(alternative)
+                        firsts.append(codes | item_follow if nullable
+                                      else codes)
+                    for j, codes in enumerate(firsts):
+                        if any(codes & other for other in firsts[j + 1:]):
+                            self.warnings.append(BacktrackingWarning(
+                                'overlapping_alternatives',
+                                'Alternatives inside a repeat can start '
+                                'with the same character'
+                            ))
+                            break
+                for alternative in alternatives:
+                    self.scan(alternative, item_follow, in_loop)
+
+            elif op is sre_parse.SUBPATTERN:
+                self.scan(av[-1], item_follow, in_loop)
+
+
+def backtracking_warnings(pattern, flags=0):
+    """
+    Look for constructs in pattern that can make the regexp engine
+    backtrack exponentially on strings that do not match:
+
+    * nested_quantifier: a variable repeat inside another repeat, where
+      the characters the inner repeat matches could also be matched by
+      what follows it (for example, (a+)+ or (\\w+\\s?)+)
+    * overlapping_alternatives: alternatives inside a repeat that can
+      start with the same character, where an alternative that can match
+      nothing starts with whatever follows it (for example, (?:\\d|1x)*
+      or (a|aa)*).  The parser factors common prefixes out of
+      alternatives, so (a|ab)*, which is not ambiguous, is not flagged.
+
+    Possessive repeats and atomic groups are not checked, since they do
+    not backtrack.
+
+    Args:
+        pattern (str or bytes): the regexp string
+        flags (int): flags the pattern will be compiled with
+    Returns:
+        list of BacktrackingWarning
+    """
+    parsed = sre_parse.parse(pattern, flags)
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    analyzer = _Analyzer(state.flags)
+    analyzer.scan(parsed, frozenset(), False)
+    return analyzer.warnings
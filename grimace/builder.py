@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from nine import basestring
+from .extender import Extender, NoOp
+from .elements import RE, StartGroup, EndGroup, Not, Repeater, FormatError
+
+
+class REBuilder(object):
+    """
+    A mutable counterpart to RE, for generating large patterns in loops.
+    An REBuilder has the same fluent vocabulary as RE, but each step
+    appends to the builder in place (and returns the builder) instead of
+    creating a new RE.  When done, freeze() returns an ordinary RE.
+
+    Each step is checked as it is added, so a misplaced end_group, a
+    repeat that would apply to the start of a group, or a not_a with
+    nothing to invert raises FormatError naming the offending step,
+    rather than surfacing only when the finished RE is stringified.
+
+        b = RE.builder()
+        for word in words:
+            b.literal(word).optional.whitespace
+        r = b.freeze()
+    """
+
+    # RE methods that add elements; all other vocabulary is made up of
+    # Extender and NoOp attributes.
+    _methods = frozenset((
+        'literal', 'regex', 'any_of', 'exactly', 'up_to', 'between',
+        'possessive_between', 'named_group', 'start_named_group', 'any_re',
+        'any_of_words',
+    ))
+
+    def __init__(self, *args):
+        """
+        Args:
+            args: REs, strings and REElements to start with, as for RE()
+        """
+        self._elements = []
+        self._steps = 0
+        # Each open group, as the (step, name) that started it
+        self._open = []
+        # The last step, if it added a Repeater, Not or StartGroup that
+        # the next element must complete
+        self._pending = None
+        if args:
+            self(*args)
+
+    def __getattr__(self, name):
+        vocabulary = vars(RE).get(name)
+        if isinstance(vocabulary, Extender):
+            self._extend(name, vocabulary)
+            return self
+        if isinstance(vocabulary, NoOp):
+            return self
+        if name in REBuilder._methods:
+            return lambda *args: self._apply(name, args)
+        raise AttributeError(name)
+
+    def __call__(self, *args):
+        """
+        With no args, return the builder, so that attribute-style
+        vocabulary may also be invoked as methods.  Otherwise, append the
+        args (REs, strings or REElements, as for RE()).
+        Returns:
+            REBuilder
+        """
+        if args:
+            self._add('()', RE(*args).elements)
+        return self
+
+    def _extend(self, name, extender):
+        """
+        Add the element for an Extender, choosing its alternate if the
+        last element is a Not.
+        """
+        if isinstance(self._last(), Not) and \
+                extender.alternate is not extender.element:
+            # The Not is used up by choosing the alternate
+            self._add(name, (extender.alternate,), resolved=True)
+        elif extender.element is not None:
+            self._add(name, (extender.element,))
+        else:
+            self._add(name, ())
+
+    def _apply(self, name, args):
+        """
+        Apply an RE method to an RE holding only the last element (which
+        is all that any method looks at), and append what it adds.  A
+        method may replace a trailing Not, as any_of() does.
+        """
+        last = self._last()
+        if last is None:
+            self._add(name, getattr(RE(), name)(*args).elements)
+            return self
+
+        added = getattr(RE(last), name)(*args).elements
+        if added and added[0] is not last:
+            self._add(name, added, resolved=True, replace=True)
+        else:
+            self._add(name, added[1:])
+        return self
+
+    def _last(self):
+        return self._elements[-1] if self._elements else None
+
+    def _add(self, name, elements, resolved=False, replace=False):
+        """
+        Validate the elements added by one step, and then append them.
+        Nothing is changed if they are invalid.
+
+        Args:
+            name (str): the vocabulary used for the step
+            elements (list): the elements it adds
+            resolved (bool): True if the step completes the pending
+                element (by choosing an inverted alternate)
+            replace (bool): True if the elements replace the last element
+        """
+        step = self._steps + 1
+        pending = None if resolved else self._pending
+        opened = list(self._open)
+
+        def fail(problem):
+            raise FormatError('Step %d (%s) %s' % (step, name, problem))
+
+        for e in elements:
+            if pending is not None:
+                if isinstance(pending[2], Not):
+                    fail('has nothing that %s can invert' %
+                         self._describe(pending))
+                if isinstance(pending[2], Repeater):
+                    if isinstance(e, Repeater):
+                        fail('follows %s, which it would override' %
+                             self._describe(pending))
+                    if isinstance(e, StartGroup):
+                        fail('cannot be repeated by %s; put the repeat '
+                             'after the group is closed' %
+                             self._describe(pending))
+
+            if isinstance(e, StartGroup):
+                opened.append((step, name))
+            elif isinstance(e, EndGroup):
+                if not opened:
+                    fail('has no matching start_group')
+                opened.pop()
+
+            if isinstance(e, (Repeater, Not, StartGroup)):
+                pending = (step, name, e)
+            elif not (isinstance(e, basestring) and not e):
+                # An empty string leaves the pending element in place
+                pending = None
+
+        self._steps = step
+        if replace:
+            self._elements.pop()
+        self._elements.extend(elements)
+        self._open = opened
+        self._pending = pending
+
+    @staticmethod
+    def _describe(pending):
+        return 'step %d (%s)' % pending[:2]
+
+    def freeze(self):
+        """
+        Return an RE with the elements built so far.  The builder may go
+        on being used; later steps do not affect the RE.
+        Returns:
+            RE
+        Raises:
+            FormatError: if a group is still open, or the last step
+                needs an element to follow it
+        """
+        if self._open:
+            step, name = self._open[-1]
+            raise FormatError(
+                'The group started at step %d (%s) is never ended' %
+                (step, name))
+        if self._pending is not None:
+            raise FormatError(
+                'The expression cannot end with %s' %
+                self._describe(self._pending))
+        return RE(list(self._elements))
+
+    def __len__(self):
+        """
+        Returns:
+            int: the number of elements added so far
+        """
+        return len(self._elements)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import re
+import threading
+from collections import OrderedDict
+
+
+class PatternCache(object):
+    """
+    A bounded, least-recently-used cache of compiled regular expression
+    objects, keyed by (pattern string, flags).  One instance is shared by
+    all RE objects (as RE.cache) so that equal patterns built separately
+    are only compiled once.
+
+    Attributes:
+        hits (int): number of lookups satisfied from the cache
+        misses (int): number of lookups that required a compile
+        evictions (int): number of entries discarded to stay in bounds
+    """
+
+    def __init__(self, maxsize=512):
+        """
+        Args:
+            maxsize (int): the maximum number of compiled objects to
+                keep.  Zero disables caching.
+        """
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._maxsize = max(0, maxsize)
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def maxsize(self):
+        """
+        Returns:
+            int: the maximum number of entries held
+        """
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        with self._lock:
+            self._maxsize = max(0, maxsize)
+            self._trim()
+
+    def _trim(self):
+        """
+        Discard least-recently-used entries until the cache is within
+        bounds.  Must be called with the lock held.
+        """
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def compile(self, pattern, flags=0):
+        """
+        Return the compiled form of pattern, compiling it only if it is
+        not already in the cache.
+
+        Args:
+            pattern (str): the regexp string
+            flags (int): flags to pass to re.compile
+
+        Returns:
+            re.RegexObject
+        """
+        key = (type(pattern), pattern, flags)
+        with self._lock:
+            compiled = self._entries.pop(key, None)
+            if compiled is not None:
+                # Re-insert to mark as most recently used
+                self._entries[key] = compiled
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        # Compile outside the lock; if two threads race on the same
+        # pattern, both results are equivalent.
+        compiled = re.compile(pattern, flags)
+        with self._lock:
+            if self._maxsize:
+                self._entries[key] = compiled
+                self._trim()
+        return compiled
+
+    def clear(self):
+        """
+        Discard all entries and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Returns:
+            dict: the hits, misses, evictions, current size and maxsize
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self._maxsize,
+            }
+
+    def __len__(self):
+        return len(self._entries)
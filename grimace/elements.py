@@ -7,9 +7,19 @@ from __future__ import (
     unicode_literals
 )
 import re
-from functools import reduce  # which is no longer a builtin in Python 3.
-from nine import basestring, str, nine
-from .extender import Extender
+import sys
+import threading
+import warnings
+import weakref
+from nine import basestring, chr, filter, map, range, str, nine
+from .extender import Extender, NoOp
+from .cache import PatternCache
+from .prefilter import PrefilteredMatcher
+from . import analysis, files, instrument, parallel, stream, trie
+
+
+# True if the re module supports possessive repeats and atomic groups
+POSSESSIVE_SUPPORTED = sys.version_info >= (3, 11)
 
 
 class REElement(object):
@@ -17,6 +27,8 @@ class REElement(object):
     Parent class for all elements that mark RE behaviour
     """
 
+    __slots__ = ()
+
     def marker(self):
         """
         Emit any marker string for this element
@@ -25,12 +37,34 @@ class REElement(object):
         """
         return ''
 
+    def _values(self):
+        """
+        Returns:
+            tuple: the attributes that distinguish this element from
+                others of the same class
+        """
+        return ()
+
+    # Elements compare by value, so that REs built from equal elements
+    # may be recognised as equal when interned.
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._values() == other._values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), self._values()))
+
 
 class PostfixGeneratingREElement(REElement):
     """
     Parent class for all elements that generate postfix strings
     """
 
+    __slots__ = ()
+
     def postfix_marker(self):
         """
         Emit any marker string for this element
@@ -48,17 +82,27 @@ class Repeater(PostfixGeneratingREElement):
     first.  E.g. one_or_more().digit()
     """
 
-    def __init__(self, minimum=0, maximum=1, greedy=True):
+    __slots__ = ('minimum', 'maximum', 'greedy', 'possessive')
+
+    def __init__(self, minimum=0, maximum=1, greedy=True, possessive=False):
         """
         Args:
             minimum (int): minimum number of repeats, default 0
             maximum (int): maximum number of repeats, may be -1 for
                 any number of repeats.
             greedy (bool): True for greedy matching, False for non-greedy
+            possessive (bool): True for possessive matching, which is
+                greedy and never gives back what it matched.  Requires
+                Python 3.11; on older versions, a greedy repeat is used
+                instead, with a warning.
         """
         self.minimum = minimum
         self.maximum = maximum
         self.greedy = greedy
+        self.possessive = possessive
+
+    def _values(self):
+        return self.minimum, self.maximum, self.greedy, self.possessive
 
     def postfix_marker(self):
         """
@@ -66,27 +110,51 @@ class Repeater(PostfixGeneratingREElement):
         Returns:
             str: the postfix marker string
         """
+        if self.possessive:
+            suffix = '+' if _possessive_supported() else ''
+        else:
+            suffix = '' if self.greedy else '?'
+
         if self.minimum == 0:
             if self.maximum < 0:
-                return '*' if self.greedy else '*?'
+                return '*' + suffix
             elif self.maximum == 1:
-                return '?' if self.greedy else '??'
+                return '?' + suffix
         elif self.minimum == 1:
             if self.maximum < 0:
-                return '+' if self.greedy else '+?'
+                return '+' + suffix
         return '{%d,%d}%s' % (
             self.minimum,
             self.maximum,
-            '' if self.greedy else '?'
+            suffix
         )
 
 
+def _possessive_supported():
+    """
+    Returns:
+        bool: True if the re module supports possessive repeats and
+            atomic groups (Python 3.11 and later).  If not, a warning is
+            issued, since the pattern will fall back to backtracking.
+    """
+    if POSSESSIVE_SUPPORTED:
+        return True
+    warnings.warn(
+        'Possessive repeats and atomic groups need Python 3.11 or later; '
+        'falling back to ordinary greedy repeats and groups',
+        RuntimeWarning
+    )
+    return False
+
+
 class StartGroup(REElement):
     """
     A StartGroup puts FOLLOWING RE elements in a group.
     The end of the group is marked by the next EndCapture
     """
 
+    __slots__ = ('group_name',)
+
     def __init__(self, name=None):
         """
         Args:
@@ -95,6 +163,9 @@ class StartGroup(REElement):
         """
         self.group_name = name
 
+    def _values(self):
+        return self.group_name,
+
     def marker(self):
         """
         Return the appropriate prefix marker for the group
@@ -107,11 +178,35 @@ class StartGroup(REElement):
             return '('
 
 
+class AtomicGroup(StartGroup):
+    """
+    An AtomicGroup puts FOLLOWING RE elements in an atomic (and
+    non-capturing) group: once the group has matched, the regexp engine
+    never backtracks into it.  The end of the group is marked by the next
+    EndGroup.  Requires Python 3.11; on older versions, a non-capturing
+    group is used instead, with a warning.
+    """
+
+    __slots__ = ()
+
+    def __init__(self):
+        StartGroup.__init__(self)
+
+    def marker(self):
+        """
+        Returns:
+            str: the prefix marker string
+        """
+        return '(?>' if _possessive_supported() else '(?:'
+
+
 class EndGroup(REElement):
     """
     An EndGroup ends a group
     """
 
+    __slots__ = ()
+
     def marker(self):
         return ')'
 
@@ -121,7 +216,8 @@ class Not(REElement):
     A Not object inverts the matching sense of the FOLLOWING character
     class, or the greediness of the FOLLOWING repeat marker
     """
-    pass
+
+    __slots__ = ()
 
 
 class FormatError(Exception):
@@ -133,6 +229,331 @@ class FormatError(Exception):
         self.message = message
 
 
+class BacktrackingError(FormatError):
+    """
+    The RE may backtrack catastrophically.  Raised by as_re() when
+    RE.strict is set.
+
+    Attributes:
+        warnings (list): the BacktrackingWarnings found by analyze()
+    """
+
+    def __init__(self, warnings):
+        FormatError.__init__(
+            self, '; '.join(warning.message for warning in warnings)
+        )
+        self.warnings = warnings
+
+
+class CharClass(REElement):
+    """
+    A CharClass matches any one character from a set, and supports set
+    algebra: union (|), intersection (&), difference (-) and negation
+    (~).  Members are held as sorted, merged ranges of code points, so
+    duplicates disappear and runs are emitted as ranges, e.g. [0-9A-Za-z].
+
+    A class may also include the category escapes \\d, \\s and \\w (and
+    their inverses), as CharClass.digit, whitespace and alphanumeric do.
+    These are combined with explicit members where the result can be
+    written as a class; where it cannot (the intersection of two
+    different categories, say), FormatError is raised.
+
+    A CharClass may be added to an RE like any other element, or passed
+    to RE.any_of(), which negates it if it follows a Not.
+
+    Attributes:
+        ranges (tuple): the (first, last) code point pairs, sorted
+        categories (frozenset): the category escapes included
+        negated (bool): True if the class matches characters NOT in it
+    """
+
+    __slots__ = ('ranges', 'categories', 'negated')
+
+    # The most characters that will be tested one by one against a
+    # category when intersecting or subtracting classes
+    enumeration_limit = 0x10000
+
+    _inverse_categories = {
+        '\\d': '\\D', '\\D': '\\d',
+        '\\s': '\\S', '\\S': '\\s',
+        '\\w': '\\W', '\\W': '\\w',
+    }
+
+    # The categories that include each category (in both Unicode and
+    # ASCII matching)
+    _category_supersets = {
+        '\\d': frozenset(('\\d', '\\S', '\\w')),
+        '\\D': frozenset(('\\D',)),
+        '\\s': frozenset(('\\s', '\\D', '\\W')),
+        '\\S': frozenset(('\\S',)),
+        '\\w': frozenset(('\\w', '\\S')),
+        '\\W': frozenset(('\\W', '\\D')),
+    }
+
+    def __init__(self, chars='', ranges=(), categories=(), negated=False):
+        """
+        Args:
+            chars (str): literal member characters; may be bytes
+            ranges (iterable): (first, last) pairs of characters or code
+                points, each including all the characters between
+            categories (iterable): category escapes such as '\\d'
+            negated (bool): True to match characters not in the class
+        """
+        points = [(ord(c), ord(c)) for c in RE._text(chars)]
+        for first, last in ranges:
+            first, last = CharClass._ord(first), CharClass._ord(last)
+            points.append((min(first, last), max(first, last)))
+        for category in categories:
+            if category not in CharClass._inverse_categories:
+                raise FormatError("Unknown character category %r" %
+                                  (category,))
+        self.ranges = CharClass._merged(points)
+        self.categories = frozenset(categories)
+        self.negated = negated
+
+    @staticmethod
+    def _ord(c):
+        return c if isinstance(c, int) else ord(RE._text(c))
+
+    @staticmethod
+    def _merged(ranges):
+        """
+        Returns:
+            tuple: the ranges sorted, with overlapping or adjacent ranges
+                merged
+        """
+        merged = []
+        for first, last in sorted(ranges):
+            if merged and first <= merged[-1][1] + 1:
+                if last > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], last)
+            else:
+                merged.append((first, last))
+        return tuple(merged)
+
+    @staticmethod
+    def _complement(ranges):
+        """
+        Returns:
+            tuple: the ranges of all code points not in ranges
+        """
+        complement = []
+        start = 0
+        for first, last in ranges:
+            if first > start:
+                complement.append((start, first - 1))
+            start = last + 1
+        if start <= sys.maxunicode:
+            complement.append((start, sys.maxunicode))
+        return tuple(complement)
+
+    @classmethod
+    def _make(cls, ranges=(), categories=(), negated=False):
+        # A category that another one in the class includes is redundant
+        supersets = CharClass._category_supersets
+        categories = [c for c in categories
+                      if not any(other != c and other in supersets[c]
+                                 for other in categories)]
+        result = cls(negated=negated, categories=categories)
+        result.ranges = cls._merged(ranges)
+        return result
+
+    def _values(self):
+        return self.ranges, self.categories, self.negated
+
+    def _positive(self):
+        """
+        Returns:
+            tuple: (ranges, categories) of a class equal to this one that
+                is not negated
+        Raises:
+            FormatError: if there is no such class
+        """
+        if not self.negated:
+            return self.ranges, self.categories
+        if not self.categories:
+            return CharClass._complement(self.ranges), frozenset()
+        if not self.ranges and len(self.categories) == 1:
+            category, = self.categories
+            return (), frozenset((CharClass._inverse_categories[category],))
+        raise FormatError("The complement of %s cannot be written as a "
+                          "character class" % self.marker())
+
+    @staticmethod
+    def _matches_category(code, categories):
+        return any(re.match('[%s]' % c, chr(code)) for c in categories)
+
+    @staticmethod
+    def _category_intersection(categories, other_categories):
+        """
+        Returns:
+            set: the categories matching what both sets of categories
+                match, or None if that cannot be written with categories
+        """
+        supersets = CharClass._category_supersets
+        inverse = CharClass._inverse_categories
+        result = set()
+        for category in categories:
+            for other in other_categories:
+                if other in supersets[category]:
+                    result.add(category)
+                elif category in supersets[other]:
+                    result.add(other)
+                elif inverse[other] not in supersets[category]:
+                    # They overlap without either including the other
+                    return None
+        return result
+
+    @staticmethod
+    def _size(ranges):
+        return sum(last - first + 1 for first, last in ranges)
+
+    def union(self, other):
+        """
+        Returns:
+            CharClass: a class matching characters in either class
+        """
+        if self.negated and other.negated:
+            return ~((~self) & (~other))
+        ranges, categories = self._positive()
+        other_ranges, other_categories = other._positive()
+        return CharClass._make(ranges + other_ranges,
+                               categories | other_categories)
+
+    def intersection(self, other):
+        """
+        Returns:
+            CharClass: a class matching characters in both classes
+        Raises:
+            FormatError: if the result cannot be written as a class
+        """
+        if self.negated and other.negated:
+            return ~((~self) | (~other))
+        ranges, categories = self._positive()
+        other_ranges, other_categories = other._positive()
+
+        # Ranges present in both are kept as ranges
+        common = []
+        for first, last in ranges:
+            for other_first, other_last in other_ranges:
+                if first <= other_last and other_first <= last:
+                    common.append((max(first, other_first),
+                                   min(last, other_last)))
+        if not categories and not other_categories:
+            return CharClass._make(common)
+
+        # Characters in one class's ranges that only the other's
+        # categories include are found one by one, if there are few
+        # enough, and categories are intersected pairwise, if each pair
+        # is disjoint or one includes the other
+        shared = CharClass._category_intersection(categories,
+                                                  other_categories)
+        size = (CharClass._size(ranges) if other_categories else 0) + \
+            (CharClass._size(other_ranges) if categories else 0)
+        if shared is not None and size <= CharClass.enumeration_limit:
+            for mine, theirs in ((ranges, other_categories),
+                                 (other_ranges, categories)):
+                common.extend(
+                    (code, code)
+                    for first, last in mine if theirs
+                    for code in range(first, last + 1)
+                    if CharClass._matches_category(code, theirs))
+            return CharClass._make(common, shared)
+
+        # Otherwise, write the result as the negation of the union of the
+        # complements, e.g. \w - \d is [^\W\d] and \s - \n is [^\S\n]
+        try:
+            ranges, categories = (~self)._positive()
+            other_ranges, other_categories = (~other)._positive()
+        except FormatError:
+            raise FormatError("The intersection of %s and %s cannot be "
+                              "written as a character class" %
+                              (self.marker(), other.marker()))
+        return CharClass._make(ranges + other_ranges,
+                               categories | other_categories, negated=True)
+
+    def difference(self, other):
+        """
+        Returns:
+            CharClass: a class matching characters in this class but not
+                in other
+        Raises:
+            FormatError: if the result cannot be written as a class
+        """
+        return self & ~other
+
+    def negation(self):
+        """
+        Returns:
+            CharClass: a class matching characters not in this class
+        """
+        return CharClass._make(self.ranges, self.categories, not self.negated)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __invert__ = negation
+
+    def __contains__(self, c):
+        code = CharClass._ord(c)
+        found = any(first <= code <= last for first, last in self.ranges) or \
+            CharClass._matches_category(code, self.categories)
+        return found != self.negated
+
+    @staticmethod
+    def _char(code):
+        """
+        Returns:
+            str: the code point as it should appear in a class
+        """
+        if code < 0x20 or 0x7f <= code < 0xa0:
+            return '\\x%02x' % code
+        return RE.escape(chr(code))
+
+    def _members(self):
+        """
+        Returns:
+            str: the members, as written between brackets
+        """
+        members = []
+        for first, last in self.ranges:
+            members.append(CharClass._char(first))
+            if last > first + 1:
+                members.append('-')
+            if last > first:
+                members.append(CharClass._char(last))
+        members.extend(sorted(self.categories))
+        return ''.join(members)
+
+    def marker(self):
+        """
+        Returns:
+            str: the class as regexp text: a single character or
+                category where that is enough, otherwise a bracketed set
+        Raises:
+            FormatError: if the class is empty, and so matches nothing
+        """
+        if self.negated:
+            if not self.ranges and not self.categories:
+                return '[\\s\\S]'
+            if not self.ranges and len(self.categories) == 1:
+                category, = self.categories
+                return CharClass._inverse_categories[category]
+            return '[^%s]' % self._members()
+
+        if not self.ranges and not self.categories:
+            raise FormatError("An empty character class matches nothing")
+        if not self.categories and len(self.ranges) == 1 and \
+                self.ranges[0][0] == self.ranges[0][1]:
+            return CharClass._char(self.ranges[0][0])
+        if not self.ranges and len(self.categories) == 1:
+            return self._members()
+        return '[%s]' % self._members()
+
+    def __repr__(self):
+        return 'CharClass(%r)' % self.marker()
+
+
 @nine
 class RE(object):
     """
@@ -146,26 +567,140 @@ class RE(object):
         elements (list(REElement): the set of elements of this RE
     """
 
-    # The list of elements that an RE holds
-    elements = []
+    # The elements of an RE are not held in a flat list.  Each instance
+    # is a node that refers to the RE it extends (its parent) and holds
+    # only the elements added at that step, so that each fluent step
+    # costs the same however long the chain already is.  An item may
+    # itself be an RE, in which case its elements are spliced in at that
+    # point.  The chain is only flattened when the elements are needed
+    # in order, which is when the RE is stringified.
+    #
+    # Alongside the chain, an instance holds its compiled regexp objects
+    # keyed by flags (created on first use by as_re()) and its regexp
+    # string (set on first stringification).
+    #
+    # Instances are slotted, with no per-instance __dict__, since fluent
+    # chains create many short-lived intermediates.
+    __slots__ = ('_parent', '_items', '_size', '_last', '_compiled',
+                 '_string', '_width', '_key', '__weakref__')
+
+    # Canonical instances created by intern(), keyed by their elements.
+    # Entries disappear when the canonical instance is no longer used.
+    _interned = weakref.WeakValueDictionary()
+    _intern_lock = threading.Lock()
+
+    # The process-wide cache of compiled regexps, shared by all instances.
+    # Its size may be changed by setting RE.cache.maxsize.
+    cache = PatternCache()
+
+    # If True, as_re() refuses to compile a regexp that analyze() warns
+    # about, raising BacktrackingError.
+    strict = False
 
     def __init__(self, *args):
         """
-        Create a new RE - the core of an RE is a list of strings or
+        Create a new RE - the core of an RE is a sequence of strings or
         REElements, which grows with each addition (or has the tail
         element modified in some cases) until stringified at the end.
-        If args are supplied: the elements list for this instance is built
-        up by adding the elements lists from any args that are instances
+        If args are supplied: the elements for this instance are built
+        up by adding the elements from any args that are instances
         of this class, and any strings or unicode strings or REElements.
         """
-        if args:
-            self.elements = reduce(RE.__reducer, args, [])
+        self._parent = None
+        self._items = ()
+        self._size = 0
+        self._last = None
+        self._compiled = None
+        self._string = None
+        self._width = None
+        self._key = None
+
+        parent = None
+        items = []
+        for arg in args:
+            if parent is None and not items and isinstance(arg, RE):
+                # The leading RE is shared rather than copied
+                if arg._size:
+                    parent = arg
+            else:
+                RE.__collect(items, arg)
+
+        if parent is not None and not items:
+            # Nothing is being added, so share the parent's node contents
+            # instead of adding another link to the chain
+            self._parent = parent._parent
+            self._items = parent._items
+            self._size = parent._size
+            self._last = parent._last
+
+        elif items:
+            self._parent = parent
+            self._items = tuple(items)
+            self._size = sum(
+                x._size if isinstance(x, RE) else 1
+                for x in items
+            ) + (parent._size if parent is not None else 0)
+            tail = items[-1]
+            self._last = tail._last if isinstance(tail, RE) else tail
+
+    # No-op attributes that may be invoked as attributes or methods
+    then = followed_by = of = of_a = of_an = NoOp()
 
-        # Add no-op and other attributes that may be invoked as
-        # attributes or methods
-        self.then = self
-        self.followed_by = self
-        self.of = self.of_a = self.of_an = self
+    @staticmethod
+    def builder(*args):
+        """
+        Return a mutable builder with the same fluent vocabulary as RE,
+        for generating large patterns in loops without creating an RE at
+        each step.  Call freeze() on the builder to get the finished RE.
+        See grimace.builder.REBuilder.
+
+        Args:
+            args: REs, strings and REElements to start with, as for RE()
+        Returns:
+            REBuilder
+        """
+        from .builder import REBuilder
+        return REBuilder(*args)
+
+    @property
+    def elements(self):
+        """
+        Returns:
+            list: the strings and REElements of this RE, in order
+        """
+        # Flatten the chain without recursion, since chains may be
+        # many thousands of links long.  Popping an RE pushes its items
+        # (in reverse) and then its parent, so the parent's elements
+        # are emitted first.
+        flattened = []
+        stack = [self]
+        while stack:
+            x = stack.pop()
+            if isinstance(x, RE):
+                stack.extend(reversed(x._items))
+                if x._parent is not None:
+                    stack.append(x._parent)
+            else:
+                flattened.append(x)
+        return flattened
+
+    def compact(self):
+        """
+        Return this RE's elements as a Program: an array of opcodes, an
+        array of operands and a table of the distinct strings, with no
+        element objects.  Program.to_re() turns it back into an RE.
+        See grimace.ir.
+        Returns:
+            Program
+        """
+        from .ir import Program
+        return Program.from_re(self)
+
+    def __reduce__(self):
+        # Pickle as the flat Program, rather than as the chain of nodes,
+        # which would need one level of recursion per link.
+        from .ir import rebuild
+        return rebuild, (self.compact(),)
 
     def __call__(self, *args, **kwargs):
         """
@@ -195,143 +730,174 @@ class RE(object):
         return isinstance(e, (basestring, REElement))
 
     @staticmethod
-    def __reducer(elements, arg):
+    def __collect(items, arg):
         """
-        Reducing function to be applied over supplied element lists
-        to combine them.
+        Append the items supplied by arg to the items list.
 
-        If arg is a string, return elements with the string appended.
-        If arg is an REElement, return elements with it appended.
-        If arg is an iterable, return elements with the elements of arg
-        appended.
-        If arg is an instance of this class, return elements with the
-        elements of that instance appended.
-
-        Returns:
-            list: list of RE, REElement or strings
+        If arg is an instance of this class, it is appended as-is, so
+        that its elements are shared rather than copied.
+        If arg is a string or an REElement, it is appended.
+        If arg is an iterable, all legal items from it are appended.
+        Anything else is silently ignored.
         """
         if isinstance(arg, RE):
-            return elements + arg.elements  # Concatenate lists
+            if arg._size:
+                items.append(arg)
 
         elif RE.__is_legal_element(arg):
-            return elements + [arg]
+            items.append(arg)
+
+        else:
+            try:
+                iterator = iter(arg)
+            except TypeError:
+                # raised if arg is not iterable, in which case we silently
+                # ignore it
+                return
+
+            for x in iterator:
+                RE.__collect(items, x)
+
+    def intern(self):
+        """
+        Return the canonical RE for this RE's pattern.  All REs that
+        produce the same regexp string intern to the same instance,
+        however their elements were split up (so RE().literal('ab') and
+        RE().literal('a').literal('b') share one instance), and share one
+        remembered string and set of compiled regexp objects.  An RE that
+        cannot yet be stringified (an unclosed group, say) is keyed by its
+        elements instead.  Uninterned REs compare by identity.
+
+        Returns:
+            RE: the canonical instance, which may be this RE
+        """
+        if self._key is not None:
+            return self
 
         try:
-            # Assume the arg is an iterable and add all legal items from
-            # it to elements by recursing.
-            return reduce(RE.__reducer, arg, elements)
+            key = str(self)
+        except FormatError:
+            key = tuple(self.elements)
+        with RE._intern_lock:
+            canonical = RE._interned.get(key)
+            if canonical is None:
+                canonical = RE._interned[key] = self
+                self._key = key
+        return canonical
+
+    def is_interned(self):
+        """
+        Returns:
+            bool: True if this RE is the canonical instance for its
+                elements
+        """
+        return self._key is not None
 
-        except TypeError:
-            # raised if arg is not iterable, in which case we silently
-            # ignore it
-            pass
+    def _without_last(self):
+        """
+        Returns:
+            RE: a new RE with the same elements as this one, less the
+                last element
+        """
+        if not self._items:
+            return RE()
+
+        tail = self._items[-1]
+        if isinstance(tail, RE):
+            return RE(self._parent, self._items[:-1], tail._without_last())
+
+        return RE(self._parent, self._items[:-1])
 
     def __stringify(self):
         """
-        Convert all elements to strings (or unicodes) and return a list
-        of them.
+        Convert all elements to strings (or unicodes) and return the
+        concatenated regexp string, decoding any bytestrings.
         Also performs some validity checks on the RE.
+        The result is remembered, since an RE never changes once built.
         Returns:
-            list of str
+            str
         """
+        if self._string is not None:
+            return self._string
 
         # An empty list returns an empty string
-        if not self.elements:
+        if not self._size:
             return ""
 
         # We know the list is not empty, so check that the end element
         # is not one that requires at least one following element.
-        trailing_element = self.elements[-1]
+        trailing_element = self._last
         if any(isinstance(trailing_element, k) for k in (StartGroup, Not)):
             raise FormatError("The expression cannot end with this element")
 
+        # This is done in one pass over the elements, which both
+        # validates the groups and builds the output.
+        #
         # Verify that every StartGroup is matched by an EndGroup.  This
         # isn't as simple as checking that the counts match - we must also
-        # spot an EndGroup coming before any StartGroup and vice versa.
+        # spot an EndGroup coming before its StartGroup, which we do by
+        # tracking the nesting depth.
         # It's worth doing this because the whole point of grimace is to
         # make it easier to write regexp's and mismatched groups are
         # an error.
-
-        # Start by finding the indexes of all start and end groups
-        start_group_indices = [
-            i
-            for i, x in enumerate(self.elements)
-            if isinstance(x, StartGroup)
-        ]
-        end_group_indices = [
-            i
-            for i, x in enumerate(self.elements)
-            if isinstance(x, EndGroup)
-        ]
+        #
+        # We also allow for an REElement that affects the element
+        # FOLLOWING it by emitting text that comes after that following
+        # element.  The best example is zero_or_more().digit() which
+        # results in [Repeater(0,-1), '\d'] and has to be stringified as
+        # "\d*" where the '*' comes from the Repeater.
+        # We can generalize this to:
+        #   Wherever an element e is a postfix-generating REElement,
+        #   hold it as pending, then emit the next non-empty string,
+        #   then emit the pending element's postfix_marker.
+        # If several postfix-generators come together, only the last one
+        # applies, and one left pending at the end is dropped.
+        strings = []
+        pending = None
+        starts = ends = depth = 0
+        misplaced = None
+
+        for e in self.elements:
+            if isinstance(e, PostfixGeneratingREElement):
+                pending = e
+                continue
+
+            if isinstance(e, basestring):
+                s = e if isinstance(e, str) else e.decode('ascii')
+            else:
+                if isinstance(e, StartGroup):
+                    starts += 1
+                    depth += 1
+                elif isinstance(e, EndGroup):
+                    ends += 1
+                    depth -= 1
+                    if depth < 0 and misplaced is None:
+                        misplaced = (
+                            'An end_group comes before the first start_group'
+                            if not starts else
+                            'An end_group has no matching start_group'
+                        )
+                s = e.marker()
+
+            # An empty string leaves any pending postfix-generator to
+            # modify the following non-empty string.
+            if s:
+                strings.append(s)
+                if pending is not None:
+                    strings.append(pending.postfix_marker())
+                    pending = None
 
         # Check that there are the same number of starts and ends
-        if len(start_group_indices) != len(end_group_indices):
+        if starts != ends:
             raise FormatError(
                 'The expression contains different numbers of start_group '
                 'and end_group elements'
             )
+        if misplaced:
+            raise FormatError(misplaced)
 
-        # If there's at least one group, then we will check for
-        # end-before-start or start-after-end
-        if len(start_group_indices) > 0:
-            if end_group_indices[0] < start_group_indices[0]:
-                raise FormatError(
-                    'An end_group comes before the first start_group'
-                )
-            elif start_group_indices[-1] > end_group_indices[-1]:
-                raise FormatError(
-                    'A start_group comes after the last end_group'
-                )
-
-        # The list processing here is a little complex, because we allow
-        # for an REElement that affects the element FOLLOWING it by
-        # emitting text that comes after that following element.  The best
-        # example is zero_or_more().digit() which results in
-        # [Repeater(0,-1), '\d'] and has to be stringified as "\d*"
-        # where the '*' comes from the Repeater.
-
-        # We can generalize this to:
-        #   Wherever an element e is an REElement object, emit e's marker,
-        #   then the result of stringifying the following element, then
-        #   emit e's postfix_marker.
-        # This is actually quite a nice little functional programming
-        # problem: how can you do this with a processor that consumes one
-        # element at a time?  The answer is by reducing, and inspecting
-        # the end of the accumulated list for postfix-generating
-        # elements.
-
-        def string_reducer(elements, e):
-            # If e is a postfix-generating REElement, then just add it to
-            # the end of the elements list
-            if isinstance(e, PostfixGeneratingREElement):
-                return elements + [e]
-
-            # Get the string or unicode version of the element
-            s = e if isinstance(e, basestring) else e.marker()
-
-            # If s is empty, then we just return the elements list as it
-            # is.  This means that any postfix-generator currently at the
-            # end of the list won't be consumed - we consider
-            # that it should modify only the following non-empty string.
-            if not s:
-                return elements
-
-            # If the tail of the list is a postfix-generator x, then return
-            # the elements list without that generator, then s, then the
-            # postfix text from x
-            if elements and isinstance(elements[-1], PostfixGeneratingREElement):
-                return elements[:-1] + [s, elements[-1].postfix_marker()]
-
-            # Just return elements with s appended
-            return elements + [s]
-
-        # Reduce to a list of strings or unicodes and return
-        strings = reduce(string_reducer, self.elements, [])
-
-        # Do one last pass in case there is a lingering postfix-generator
-        # in the list, which was left because there was an empty string
-        # following it.
-        return [x for x in strings if isinstance(x, basestring)]
+        self._string = ''.join(strings)
+        return self._string
 
     def __str__(self):
         """
@@ -339,10 +905,7 @@ class RE(object):
         Returns:
             str
         """
-        return ''.join(
-            x if isinstance(x, str) else x.decode('ascii')
-            for x in self.__stringify()
-        )
+        return self.__stringify()
 
     def ends_with_not(self):
         """
@@ -351,7 +914,7 @@ class RE(object):
         """
         # This is technically a private method, but it's not mangle-named
         # so that the Extender class may use it.
-        return self.elements and isinstance(self.elements[-1], Not)
+        return isinstance(self._last, Not)
 
     # Result methods
 
@@ -369,16 +932,354 @@ class RE(object):
     UNICODE = re.UNICODE
     DEBUG = re.DEBUG
 
-    def as_re(self, flags=0):
+    def as_re(self, flags=0, optimize=False):
         """
         Return a compiled regular expression object.  The flags parameter
         is passed to re.compile.  However, the only real use for it is to
         pass re.IGNORECASE, re.LOCALE or re.UNICODE.
 
+        The compiled object is remembered by this RE, so repeated calls
+        with the same flags are a dictionary lookup.  Otherwise, the
+        shared RE.cache is consulted before compiling.
+
+        If instrumentation is enabled (see grimace.instrument), the
+        compiled object is wrapped to record how it is used.
+
+        Args:
+            flags (int): flags for re.compile
+            optimize (bool): if True, compile the shorter, equivalent
+                regexp given by optimized().  This is ignored if flags
+                include re.VERBOSE, which changes how the text is read.
+
+        Returns:
+            re.RegexObject
+        """
+        key = ('optimized', flags) if optimize else flags
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = {}
+        elif key in compiled:
+            result = compiled[key]
+            return result if instrument.active is None else \
+                instrument.active.wrap(result)
+
+        if optimize and not flags & re.VERBOSE:
+            pattern = self.optimized().as_string()
+        else:
+            pattern = str(self)
+        result = compiled[key] = self.__compile(pattern, flags)
+        return result if instrument.active is None else \
+            instrument.active.wrap(result)
+
+    def optimized(self):
+        """
+        Return an equivalent RE whose regexp is shorter where possible:
+        runs such as digit.digit.digit become \\d{3}, redundant repeats
+        such as the {1,1} from a/an/one are dropped, and alternatives
+        making up a whole group have their shared prefix factored out.
+        Group numbers and names are unchanged.  See grimace.optimizer.
+
+        Raises:
+            FormatError: if the RE is badly formatted
+        Returns:
+            RE
+        """
+        from .optimizer import optimize
+        # Stringify first, to validate the RE
+        str(self)
+        return RE(optimize(self.elements))
+
+    def __compile(self, pattern, flags):
+        """
+        Compile the pattern through the shared cache, first checking it
+        for backtracking problems if RE.strict is set.
+        Raises:
+            BacktrackingError: if RE.strict is set and analysis finds a
+                problem
+        Returns:
+            re.RegexObject
+        """
+        if RE.strict:
+            warnings = analysis.backtracking_warnings(pattern, flags)
+            if warnings:
+                raise BacktrackingError(warnings)
+
+        registry = instrument.active
+        if registry is None:
+            return RE.cache.compile(pattern, flags)
+
+        started = instrument.timer()
+        result = RE.cache.compile(pattern, flags)
+        registry.record_compile(result, instrument.timer() - started)
+        return result
+
+    def analyze(self, flags=0):
+        """
+        Check the regexp for constructs that can make matching take
+        exponential time on strings that do not match: a variable repeat
+        nested in another repeat where the same characters could be
+        matched by either, and overlapping alternatives inside a repeat.
+        See grimace.analysis.backtracking_warnings.
+
+        Set RE.strict to True to have as_re() raise BacktrackingError
+        (a FormatError) instead of compiling such a regexp.
+        Returns:
+            list of grimace.analysis.BacktrackingWarning
+        """
+        return analysis.backtracking_warnings(str(self), flags)
+
+    def as_bytes(self):
+        """
+        Return the regexp as a bytes string, for matching bytes,
+        bytearray, memoryview or mmap objects without decoding them.
+        Literals given as bytes are reproduced exactly; text is encoded
+        as latin-1.
+
+        Raises:
+            FormatError: if the regexp contains a character that cannot
+                be encoded as latin-1
+        Returns:
+            bytes
+        """
+        try:
+            return str(self).encode('latin-1')
+        except UnicodeEncodeError:
+            raise FormatError(
+                'The expression contains characters that cannot be used in '
+                'a bytes pattern'
+            )
+
+    def as_bytes_re(self, flags=0):
+        """
+        Return a compiled bytes regular expression object, remembered and
+        cached in the same way as for as_re().  Note that re.UNICODE may
+        not be used with a bytes pattern in Python 3.
+
         Returns:
             re.RegexObject
         """
-        return re.compile(str(self), flags)
+        key = (bytes, flags)
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = {}
+        elif key in compiled:
+            result = compiled[key]
+            return result if instrument.active is None else \
+                instrument.active.wrap(result)
+
+        result = compiled[key] = self.__compile(self.as_bytes(), flags)
+        return result if instrument.active is None else \
+            instrument.active.wrap(result)
+
+    def __width(self):
+        """
+        Returns:
+            tuple: the (minimum, maximum) match lengths, remembered after
+                the first call
+        """
+        if self._width is None:
+            self._width = analysis.width(str(self))
+        return self._width
+
+    def min_length(self):
+        """
+        Any text shorter than this cannot contain a match, so it can be
+        rejected without running the regexp at all.
+        Returns:
+            int: the minimum length of text that this RE can match
+        """
+        return self.__width()[0]
+
+    def max_length(self):
+        """
+        Returns:
+            int: the maximum length of text that this RE can match, or
+                None if there is no limit (for example, if the RE
+                contains one_or_more or zero_or_more)
+        """
+        return self.__width()[1]
+
+    def required_literals(self):
+        """
+        Returns:
+            list: the literal substrings that any matching text must
+                contain.  Literals inside optional repeats or
+                alternatives are not included.
+        """
+        return analysis.required_literals(str(self))[0]
+
+    def prefiltered(self, flags=0, binary=False):
+        """
+        Return a matcher that checks for a literal that every match must
+        contain (using 'in' or startswith) before running the regexp,
+        and counts how many strings pass that check.
+        Args:
+            flags (int): flags passed to as_re()
+            binary (bool): True to match bytes, using as_bytes_re()
+        Returns:
+            grimace.prefilter.PrefilteredMatcher
+        """
+        compiled = self.as_bytes_re(flags) if binary else self.as_re(flags)
+        return PrefilteredMatcher(compiled)
+
+    def finditer_file(self, path, flags=0, line_numbers=False):
+        """
+        Memory-map the file at path and find all matches of the bytes
+        form of this RE in it (see as_bytes_re()), without reading the
+        file into Python strings.  Match offsets are byte offsets in the
+        file.
+        Args:
+            path (str): the file to scan
+            flags (int): flags passed to as_bytes_re()
+            line_numbers (bool): if True, yield (line number, match)
+                pairs, with line numbers counted from 1
+        Yields:
+            match objects, or (int, match) pairs
+        """
+        return files.finditer_file(self.as_bytes_re(flags), path,
+                                   line_numbers)
+
+    scan_file = finditer_file
+
+    def parallel_finditer(self, source, workers=None, flags=0,
+                          chunk_size=parallel.DEFAULT_CHUNK_SIZE):
+        """
+        Find all matches of the bytes form of this RE in source, which is
+        split into chunks scanned by a pool of worker processes.  Workers
+        are sent the pattern string and flags, never the RE itself.
+        See grimace.parallel.parallel_finditer for how chunk boundaries
+        are handled.
+        Args:
+            source: a file path (which each worker maps for itself), or
+                a bytes, bytearray or mmap object
+            workers (int): number of worker processes, defaulting to the
+                number of CPUs
+            flags (int): flags to compile the pattern with
+            chunk_size (int): the size of each chunk in bytes
+        Yields:
+            grimace.parallel.ChunkMatch: in offset order
+        """
+        return parallel.parallel_finditer(self.as_bytes(), source, flags,
+                                          workers, chunk_size)
+
+    # Asynchronous result methods.  grimace.aio uses async syntax, so it
+    # is imported only when one of these is called, on Python 3.6+.
+
+    def amatch_stream(self, reader, flags=0, search=True, **kwargs):
+        """
+        Match this RE against each line of an asyncio.StreamReader (or
+        each item of any async iterable of str or bytes) without blocking
+        the event loop.  See grimace.aio.amatch_stream for the batch_size,
+        executor_threshold and executor keyword arguments.
+        Args:
+            reader: an asyncio.StreamReader or async iterable
+            flags (int): flags passed to as_re() or as_bytes_re()
+            search (bool): if True, search each item, else match it
+        Returns:
+            async generator: yielding a match object for each item that
+                matches
+        """
+        from . import aio
+        return aio.amatch_stream(self, reader, flags, search, **kwargs)
+
+    def afinditer(self, source, flags=0, **kwargs):
+        """
+        Find every match of this RE in each item of an async iterable of
+        str or bytes, such as an asyncio.StreamReader, without blocking
+        the event loop.  See grimace.aio.afinditer.
+        Args:
+            source: an asyncio.StreamReader or async iterable
+            flags (int): flags passed to as_re() or as_bytes_re()
+        Returns:
+            async generator: yielding match objects in order
+        """
+        from . import aio
+        return aio.afinditer(self, source, flags, **kwargs)
+
+    def stream_matcher(self, flags=0, limit=stream.DEFAULT_LIMIT):
+        """
+        Find matches in input that arrives in chunks, keeping only as
+        much of it as a match could still use.
+        Args:
+            flags (int): flags passed to as_re() or as_bytes_re()
+            limit (int): the longest match assumed, if the RE has no
+                maximum match length
+        Returns:
+            StreamMatcher: call feed() with each chunk and close() at the
+                end of the input; each returns a list of StreamMatch
+        """
+        return stream.StreamMatcher(self, flags, limit)
+
+    # Batch result methods.  Each binds the compiled method once and
+    # maps it over the iterable, so there is no per-item attribute lookup.
+    # The iterable may hold strings or, for a bytes pattern, bytes.
+
+    def match_many(self, strings, flags=0, as_list=False):
+        """
+        Match the start of each of the strings against the compiled RE.
+        Args:
+            strings (iterable): the strings to match
+            flags (int): flags passed to as_re()
+            as_list (bool): True to return a list rather than an iterator
+        Returns:
+            iterator or list: a match object or None for each string
+        """
+        results = map(self.as_re(flags).match, strings)
+        return list(results) if as_list else results
+
+    def search_many(self, strings, flags=0, as_list=False):
+        """
+        Search each of the strings for the compiled RE.
+        Args:
+            strings (iterable): the strings to search
+            flags (int): flags passed to as_re()
+            as_list (bool): True to return a list rather than an iterator
+        Returns:
+            iterator or list: a match object or None for each string
+        """
+        results = map(self.as_re(flags).search, strings)
+        return list(results) if as_list else results
+
+    def findall_many(self, strings, flags=0, as_list=False):
+        """
+        Find all matches of the compiled RE in each of the strings.
+        Args:
+            strings (iterable): the strings to search
+            flags (int): flags passed to as_re()
+            as_list (bool): True to return a list rather than an iterator
+        Returns:
+            iterator or list: for each string, the list of matched
+                strings, or of tuples of groups if the RE has more
+                than one group (as for re.findall)
+        """
+        results = map(self.as_re(flags).findall, strings)
+        return list(results) if as_list else results
+
+    def test_many(self, strings, flags=0, search=True, as_list=False):
+        """
+        Test whether each of the strings contains (or, if search is
+        False, starts with) a match for the compiled RE.
+        Returns:
+            iterator or list: True or False for each string
+        """
+        compiled = self.as_re(flags)
+        results = map(bool, map(
+            compiled.search if search else compiled.match, strings
+        ))
+        return list(results) if as_list else results
+
+    def filter_many(self, strings, flags=0, search=True):
+        """
+        Search (or, if search is False, match) each of the strings and
+        yield only the successful matches.  The matched string is
+        available as the match object's string attribute.
+        Returns:
+            iterator: match objects
+        """
+        compiled = self.as_re(flags)
+        return filter(None, map(
+            compiled.search if search else compiled.match, strings
+        ))
 
     # The remaining methods are fluent
 
@@ -398,25 +1299,38 @@ class RE(object):
         """
         return RE.backslash + c if c in RE.metacharacters else c
 
+    @staticmethod
+    def _text(s):
+        """
+        Returns:
+            str: s, decoded as latin-1 if it is bytes, so that each byte
+                becomes the character with the same value and can be
+                encoded back exactly by as_bytes()
+        """
+        if isinstance(s, (bytes, bytearray)):
+            return bytes(s).decode('latin-1')
+        return s
+
     # Basic elements, character classes
 
     def literal(self, s):
         """
         Add the literal string s to the regexp, escaping any
-        metacharacters.
+        metacharacters.  s may be bytes, for use with as_bytes_re().
         Returns:
             RE
         """
-        return RE(self, ''.join(map(RE.escape, s)))
+        return RE(self, ''.join(map(RE.escape, RE._text(s))))
 
     def regex(self, s):
         """
         Add the given string to the regex without any escaping, so that
-        legal regex character groupings may be used.
+        legal regex character groupings may be used.  s may be bytes, for
+        use with as_bytes_re().
         Returns:
             RE
         """
-        return RE(self, s)
+        return RE(self, RE._text(s))
 
     digits = digit = Extender(r'\d', r'\D')
     """
@@ -471,17 +1385,19 @@ class RE(object):
     def any_of(self, s):
         """
         Match on any of the characters in the string s, treated as
-        LITERALS, and escaped.  If you want to put an actual RE expression
-        such as [a-z] in, use regex().
+        LITERALS.  s may be bytes, or a CharClass.  Duplicates are
+        dropped and runs of characters are written as ranges, so
+        any_of('abcdef') gives [a-f].  If you want to put an actual RE
+        expression such as [a-z] in, use regex() or a CharClass.
         If the preceding element is a Not, invert the sense of the match.
         Returns:
             RE
         """
-        charset = ''.join(map(RE.escape, s))
+        charset = s if isinstance(s, CharClass) else CharClass(s)
         if self.ends_with_not():
-            return RE(self.elements[:-1], "[^%s]" % charset)
+            return RE(self._without_last(), ~charset)
 
-        return RE(self, "[%s]" % charset)
+        return RE(self, charset)
 
     # repeat filters
     any_number_of = zero_or_more = Extender(Repeater(minimum=0, maximum=-1),
@@ -510,6 +1426,36 @@ class RE(object):
         RE
     """
 
+    possessive_zero_or_more = Extender(
+        Repeater(minimum=0, maximum=-1, possessive=True)
+    )
+    """
+    The FOLLOWING element matches when repeated zero or more times,
+    possessively: as many repeats as possible are matched, and none are
+    given back if the rest of the expression then fails to match.
+    Returns:
+        RE
+    """
+
+    possessive_optional = possessive_zero_or_one = Extender(
+        Repeater(minimum=0, maximum=1, possessive=True)
+    )
+    """
+    The FOLLOWING element matches when repeated zero or once, possessively
+    Returns:
+        RE
+    """
+
+    possessive_one_or_more = possessive_at_least_one = Extender(
+        Repeater(minimum=1, maximum=-1, possessive=True)
+    )
+    """
+    The FOLLOWING element matches when repeated one or more times,
+    possessively
+    Returns:
+        RE
+    """
+
     def exactly(self, n):
         """
         The FOLLOWING element matches when repeated n times - greediness
@@ -544,6 +1490,16 @@ class RE(object):
         """
         return RE(self, Repeater(minimum=min(n, m), maximum=max(n, m)))
 
+    def possessive_between(self, n, m):
+        """
+        The FOLLOWING element matches when repeated at least n times and
+        at most m times, possessively.
+        Returns:
+            RE
+        """
+        return RE(self, Repeater(minimum=min(n, m), maximum=max(n, m),
+                                 possessive=True))
+
     # Convenience methods
 
     dot = Extender(r'\.')
@@ -629,6 +1585,14 @@ class RE(object):
         RE
     """
 
+    atomic_group = start_atomic_group = Extender(AtomicGroup())
+    """
+    Start an atomic group, which is ended by end_group.  Once an atomic
+    group has matched, the regexp engine never backtracks into it.
+    Returns:
+        RE
+    """
+
     end_group = Extender(EndGroup())
     """
     End a capture group
@@ -651,3 +1615,32 @@ class RE(object):
                 for x in args
             )
         )
+
+    def any_of_words(self, words):
+        """
+        Match on any of the words, which are treated as LITERALS and
+        escaped.  The alternatives are factored into a prefix trie, so
+        that ['foobar', 'foobaz', 'foo'] gives 'foo(?:ba[rz])?', which
+        the regexp engine matches in time proportional to the word
+        length rather than the number of words.  Where several words
+        match at the same position, the longest is matched.  The result
+        is a single (non-capturing) group, so it may be repeated.
+        Returns:
+            RE
+        """
+        pattern = trie.trie_pattern(map(RE._text, words), RE.escape)
+        if not pattern:
+            return RE(self)
+        if not (pattern.startswith('(') and pattern.endswith(')') or
+                pattern.startswith('[') and pattern.endswith(']') or
+                len(pattern) == 1):
+            pattern = '(?:%s)' % pattern
+        return RE(self, pattern)
+
+
+# Character classes matching the RE vocabulary of the same names
+CharClass.digit = CharClass.digits = CharClass(categories=['\\d'])
+CharClass.whitespace = CharClass(categories=['\\s'])
+CharClass.alphanumeric = CharClass.alphanumerics = \
+    CharClass(categories=['\\w'])
+CharClass.alpha = CharClass(ranges=[('a', 'z'), ('A', 'Z')])
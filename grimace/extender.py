@@ -40,3 +40,22 @@ class Extender(object):
 
         else:
             return klass(instance)
+
+
+class NoOp(object):
+    """
+    A NoOp is a descriptor intended for use with RE objects, whose
+    __get__ method returns the RE on which it was invoked.  It exists so
+    that conjunctions like then and followed_by can be invoked as
+    attributes or methods without each RE holding references to itself.
+    """
+    def __get__(self, instance, klass):
+        """
+        Args:
+            instance: RE instance
+            klass: RE class
+
+        Returns:
+            RE
+        """
+        return self if instance is None else instance
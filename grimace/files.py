@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scanning files through memory maps, so that matching a large file
+neither reads it into Python strings nor iterates over its lines.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import mmap
+import os
+
+# The largest slice copied at a time when counting newlines
+COUNT_CHUNK_SIZE = 1 << 20
+
+
+def map_file(path):
+    """
+    Map the file at path into memory, read-only.  The file itself is
+    closed on return; the map remains valid until it is closed or
+    garbage-collected.
+
+    Returns:
+        mmap.mmap: the map, or None if the file is empty (and so cannot
+            be mapped)
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Tell the kernel we will read sequentially, where that is supported
+    if hasattr(buffer, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        buffer.madvise(mmap.MADV_SEQUENTIAL)
+    return buffer
+
+
+def count_newlines(buffer, start, end):
+    """
+    Returns:
+        int: the number of newlines in buffer[start:end], counted in
+            bounded slices so memory use stays flat
+    """
+    count = 0
+    while start < end:
+        stop = min(start + COUNT_CHUNK_SIZE, end)
+        count += buffer[start:stop].count(b'\n')
+        start = stop
+    return count
+
+
+def finditer_buffer(compiled, buffer, line_numbers=False):
+    """
+    Run compiled.finditer over buffer.
+
+    Args:
+        compiled: a compiled bytes regexp
+        buffer: any bytes-like object, such as an mmap
+        line_numbers (bool): if True, yield (line number, match) pairs,
+            with lines counted from 1.  Line numbers are computed
+            incrementally from the previous match, so the buffer is only
+            counted once.
+    Yields:
+        match objects, or (int, match) pairs
+    """
+    if not line_numbers:
+        for match in compiled.finditer(buffer):
+            yield match
+        return
+
+    line = 1
+    counted_to = 0
+    for match in compiled.finditer(buffer):
+        start = match.start()
+        line += count_newlines(buffer, counted_to, start)
+        counted_to = start
+        yield line, match
+
+
+def finditer_file(compiled, path, line_numbers=False):
+    """
+    Map the file at path and yield the matches of compiled in it, as
+    for finditer_buffer.  The match objects refer to the map, which stays
+    open while any of them are alive.
+    """
+    buffer = map_file(path)
+    if buffer is None:
+        return
+
+    for result in finditer_buffer(compiled, buffer, line_numbers):
+        yield result
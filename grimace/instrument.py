@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in instrumentation of compiled patterns.  While enabled, as_re()
+and as_bytes_re() return InstrumentedPattern wrappers that record, for
+each pattern, how long it took to compile, how often it is used, how
+often it matches and how long matching takes.
+
+    from grimace import instrument
+    registry = instrument.enable()
+    registry.label(my_re, 'request-line')
+    ...
+    print(registry.as_dict())
+    instrument.disable()
+
+When disabled (the default), the only cost is one attribute check in
+as_re().
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import threading
+import time
+from nine import basestring
+
+# The registry in use, or None if instrumentation is disabled
+active = None
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class PatternStats(object):
+    """
+    The statistics recorded for one pattern (with one set of flags)
+    """
+
+    __slots__ = ('pattern', 'flags', 'compiles', 'compile_time', 'calls',
+                 'matches', 'misses', 'match_time')
+
+    def __init__(self, pattern, flags):
+        self.pattern = pattern
+        self.flags = flags
+        self.compiles = self.calls = self.matches = self.misses = 0
+        self.compile_time = self.match_time = 0.0
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: the statistics, including the fraction of calls that
+                matched
+        """
+        return {
+            'pattern': self.pattern,
+            'flags': self.flags,
+            'compiles': self.compiles,
+            'compile_time': self.compile_time,
+            'calls': self.calls,
+            'matches': self.matches,
+            'misses': self.misses,
+            'match_ratio': (self.matches / self.calls
+                            if self.calls else None),
+            'match_time': self.match_time,
+        }
+
+
+class InstrumentedPattern(object):
+    """
+    Wraps a compiled regexp, recording each call in a PatternStats.
+    Attributes not wrapped here (pattern, flags, groups, groupindex and
+    so on) are those of the compiled regexp.
+    """
+
+    def __init__(self, compiled, stats):
+        self.compiled = compiled
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.compiled, name)
+
+    def _timed(self, method, args, kwargs):
+        stats = self.stats
+        started = timer()
+        result = method(*args, **kwargs)
+        stats.match_time += timer() - started
+        stats.calls += 1
+        if result:
+            stats.matches += 1
+        else:
+            stats.misses += 1
+        return result
+
+    def match(self, *args, **kwargs):
+        return self._timed(self.compiled.match, args, kwargs)
+
+    def search(self, *args, **kwargs):
+        return self._timed(self.compiled.search, args, kwargs)
+
+    def fullmatch(self, *args, **kwargs):
+        return self._timed(self.compiled.fullmatch, args, kwargs)
+
+    def findall(self, *args, **kwargs):
+        return self._timed(self.compiled.findall, args, kwargs)
+
+    def split(self, *args, **kwargs):
+        return self._timed(self.compiled.split, args, kwargs)
+
+    def sub(self, *args, **kwargs):
+        return self._timed(self.compiled.sub, args, kwargs)
+
+    def subn(self, *args, **kwargs):
+        return self._timed(self.compiled.subn, args, kwargs)
+
+    def finditer(self, *args, **kwargs):
+        """
+        As for compiled.finditer; the time spent producing each match is
+        recorded, and the call counts as a match if it yields anything.
+        """
+        stats = self.stats
+        iterator = self.compiled.finditer(*args, **kwargs)
+        matched = False
+        try:
+            while True:
+                started = timer()
+                try:
+                    match = next(iterator)
+                finally:
+                    stats.match_time += timer() - started
+                matched = True
+                yield match
+        except StopIteration:
+            pass
+        finally:
+            stats.calls += 1
+            if matched:
+                stats.matches += 1
+            else:
+                stats.misses += 1
+
+
+class Registry(object):
+    """
+    Holds the statistics for every pattern compiled or used while
+    instrumentation is enabled, keyed by (pattern string, flags), where
+    flags are those of the compiled object.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._wrappers = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+
+    def stats_for(self, pattern, flags):
+        """
+        Returns:
+            PatternStats: the statistics for the pattern, created if need
+                be
+        """
+        key = (pattern, flags)
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key,
+                                               PatternStats(pattern, flags))
+        return stats
+
+    def record_compile(self, compiled, seconds):
+        """
+        Record the time taken to compile a pattern.  Like wrap(), this
+        keys the stats by the compiled object's pattern and flags, which
+        include any flags that re adds (such as re.UNICODE).
+        """
+        stats = self.stats_for(compiled.pattern, compiled.flags)
+        stats.compiles += 1
+        stats.compile_time += seconds
+
+    def wrap(self, compiled):
+        """
+        Returns:
+            InstrumentedPattern: the wrapper for compiled, which is the
+                same object each time for the same pattern and flags
+        """
+        key = (compiled.pattern, compiled.flags)
+        wrapper = self._wrappers.get(key)
+        if wrapper is None:
+            # Look up the stats first, since stats_for takes the lock
+            stats = self.stats_for(*key)
+            with self._lock:
+                wrapper = self._wrappers.get(key)
+                if wrapper is None:
+                    wrapper = self._wrappers[key] = InstrumentedPattern(
+                        compiled, stats
+                    )
+        return wrapper
+
+    def label(self, r, name):
+        """
+        Report the statistics for an RE's pattern under name, instead of
+        under the pattern string.
+        Args:
+            r (RE or str): the RE, or its pattern string
+            name (str): the label
+        """
+        self._labels[r if isinstance(r, basestring) else str(r)] = name
+
+    def reset(self):
+        """
+        Discard all statistics (labels are kept)
+        """
+        with self._lock:
+            self._stats.clear()
+            self._wrappers.clear()
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: for each pattern, keyed by its label or its pattern
+                string, the dict from PatternStats.as_dict().  If a
+                pattern was used with several sets of flags, the flags are
+                appended to the key.
+        """
+        counts = {}
+        for pattern, flags in self._stats:
+            counts[pattern] = counts.get(pattern, 0) + 1
+
+        result = {}
+        for (pattern, flags), stats in sorted(self._stats.items(),
+                                              key=lambda item: repr(item[0])):
+            text = pattern.decode('latin-1') \
+                if isinstance(pattern, bytes) else pattern
+            key = self._labels.get(text, text)
+            if counts[pattern] > 1:
+                key = '%s (flags=%d)' % (key, flags)
+            entry = stats.as_dict()
+            entry['pattern'] = text
+            result[key] = entry
+        return result
+
+
+def enable(registry=None):
+    """
+    Start instrumenting compiled patterns.  Patterns already returned by
+    as_re() are not affected; call as_re() again to get the wrapper.
+    Args:
+        registry (Registry): the registry to record into, or None for a
+            new one
+    Returns:
+        Registry: the registry in use
+    """
+    global active
+    active = registry if registry is not None else Registry()
+    return active
+
+
+def disable():
+    """
+    Stop instrumenting.  as_re() returns plain compiled objects again.
+    Returns:
+        Registry: the registry that was in use, or None
+    """
+    global active
+    registry, active = active, None
+    return registry
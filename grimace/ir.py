@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""
+A compact, flat representation of an RE's elements, for holding many
+finished patterns and for shipping them between processes.
+
+A Program is an array of one-byte opcodes, an array of integer operands
+and a table of the distinct strings used.  It holds no element objects,
+and converting it back to an RE shares one instance of each distinct
+element among all the REs so created.  REs pickle as Programs, so that
+even very long fluent chains pickle in constant stack depth.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import threading
+from array import array
+from nine import basestring, range
+from .elements import (RE, Repeater, StartGroup, AtomicGroup, EndGroup, Not,
+                       CharClass, FormatError)
+
+# Opcodes.  TEXT and START_GROUP take one operand, an index into the
+# string table (or -1 for an unnamed group); REPEAT takes three: the
+# minimum, the maximum and the flag bits below.  CHAR_CLASS takes the
+# flag bits, the number of ranges, the first and last code point of
+# each range, the number of categories and a string index for each.
+TEXT = 0
+REPEAT = 1
+START_GROUP = 2
+ATOMIC_GROUP = 3
+END_GROUP = 4
+NOT = 5
+CHAR_CLASS = 6
+
+NON_GREEDY = 1
+POSSESSIVE = 2
+NEGATED = 1
+
+# Shared element instances, keyed by their values.  Elements are never
+# modified once created, so one instance can serve every RE.
+_shared = {}
+_shared_lock = threading.Lock()
+_SHARED_LIMIT = 4096
+
+
+def shared(element):
+    """
+    Args:
+        element (REElement): an element
+    Returns:
+        REElement: the shared instance equal to element
+    """
+    existing = _shared.get(element)
+    if existing is not None:
+        return existing
+    with _shared_lock:
+        if len(_shared) >= _SHARED_LIMIT:
+            return element
+        return _shared.setdefault(element, element)
+
+
+_END_GROUP = shared(EndGroup())
+_NOT = shared(Not())
+_ATOMIC_GROUP = shared(AtomicGroup())
+
+
+class Program(object):
+    """
+    The flat form of an RE's elements.
+
+    Attributes:
+        ops (array): one opcode per element
+        args (array): the operands of all the opcodes, in order
+        strings (tuple): the distinct strings, indexed by the operands of
+            TEXT and START_GROUP
+    """
+
+    __slots__ = ('ops', 'args', 'strings')
+
+    def __init__(self, ops, args, strings):
+        self.ops = ops
+        self.args = args
+        self.strings = strings
+
+    @classmethod
+    def from_re(cls, r):
+        """
+        Args:
+            r (RE): the RE to encode
+        Returns:
+            Program
+        """
+        ops = array(str('B'))
+        args = array(str('l'))
+        strings = []
+        indexes = {}
+
+        def string_index(s):
+            index = indexes.get(s)
+            if index is None:
+                index = indexes[s] = len(strings)
+                strings.append(s)
+            return index
+
+        for e in r.elements:
+            if isinstance(e, basestring):
+                ops.append(TEXT)
+                args.append(string_index(e))
+            elif isinstance(e, Repeater):
+                ops.append(REPEAT)
+                args.extend((e.minimum, e.maximum,
+                             (0 if e.greedy else NON_GREEDY) |
+                             (POSSESSIVE if e.possessive else 0)))
+            elif isinstance(e, AtomicGroup):
+                ops.append(ATOMIC_GROUP)
+            elif isinstance(e, StartGroup):
+                ops.append(START_GROUP)
+                args.append(-1 if e.group_name is None
+                            else string_index(e.group_name))
+            elif isinstance(e, EndGroup):
+                ops.append(END_GROUP)
+            elif isinstance(e, Not):
+                ops.append(NOT)
+            elif isinstance(e, CharClass):
+                ops.append(CHAR_CLASS)
+                args.append(NEGATED if e.negated else 0)
+                args.append(len(e.ranges))
+                for first, last in e.ranges:
+                    args.extend((first, last))
+                args.append(len(e.categories))
+                args.extend(string_index(c) for c in sorted(e.categories))
+            else:
+                raise FormatError("Cannot encode element %r" % (e,))
+        return cls(ops, args, tuple(strings))
+
+    def elements(self):
+        """
+        Returns:
+            list: the elements, using shared element instances
+        """
+        strings = self.strings
+        args = iter(self.args)
+        elements = []
+        for op in self.ops:
+            if op == TEXT:
+                elements.append(strings[next(args)])
+            elif op == REPEAT:
+                minimum, maximum, flags = next(args), next(args), next(args)
+                elements.append(shared(Repeater(
+                    minimum, maximum, greedy=not flags & NON_GREEDY,
+                    possessive=bool(flags & POSSESSIVE))))
+            elif op == START_GROUP:
+                index = next(args)
+                elements.append(shared(StartGroup(
+                    None if index < 0 else strings[index])))
+            elif op == ATOMIC_GROUP:
+                elements.append(_ATOMIC_GROUP)
+            elif op == END_GROUP:
+                elements.append(_END_GROUP)
+            elif op == NOT:
+                elements.append(_NOT)
+            elif op == CHAR_CLASS:
+                flags = next(args)
+                ranges = [(next(args), next(args))
+                          for _ in range(next(args))]
+                categories = [strings[next(args)] for _ in range(next(args))]
+                elements.append(shared(CharClass(
+                    ranges=ranges, categories=categories,
+                    negated=bool(flags & NEGATED))))
+            else:
+                raise FormatError("Unknown opcode %d" % op)
+        return elements
+
+    def to_re(self):
+        """
+        Returns:
+            RE: an RE with the program's elements, as a single node
+        """
+        return RE(self.elements())
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __eq__(self, other):
+        return isinstance(other, Program) and \
+            (self.ops, self.args, self.strings) == \
+            (other.ops, other.args, other.strings)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((tuple(self.ops), tuple(self.args), self.strings))
+
+    def __getstate__(self):
+        return self.ops, self.args, self.strings
+
+    def __setstate__(self, state):
+        self.ops, self.args, self.strings = state
+
+
+def rebuild(program):
+    """
+    Returns:
+        RE: the RE for program; used when unpickling an RE
+    """
+    return program.to_re()
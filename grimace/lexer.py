@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple, OrderedDict
+from .reset import RESet
+
+Token = namedtuple('Token', ('type', 'text', 'offset'))
+"""
+A token emitted by a Lexer: its type (the name it was given in the
+Lexer's token mapping), the matched text and the offset of that text
+in the input.
+"""
+
+
+class LexError(Exception):
+    """
+    The input contains text that matches none of the token patterns
+    """
+
+    def __init__(self, message="No token matches the input", offset=None):
+        self.message = message
+        self.offset = offset
+
+
+class Lexer(object):
+    """
+    A Lexer splits text into tokens, using an ordered mapping of token
+    type name to RE.  All the token REs are compiled into one master
+    pattern (via RESet), so tokenizing is a single finditer scan rather
+    than one attempt per token type per position.
+
+    Where more than one token type could match at the same position,
+    the earliest in the mapping wins, so list keywords before the more
+    general patterns that would also match them.
+    """
+
+    def __init__(self, tokens, skip=(), error_token=None, flags=0):
+        """
+        Args:
+            tokens: an ordered mapping of token type name to RE, or a
+                sequence of (name, RE) pairs
+            skip (iterable): names of token types that are matched but
+                not emitted, such as whitespace or comments
+            error_token (str): if None (the default), text that matches
+                no token raises LexError.  Otherwise, each run of
+                unmatched text is emitted as a token of this type and
+                tokenizing continues after it.
+            flags (int): flags passed to as_re() for the master pattern
+        """
+        if not hasattr(tokens, 'items'):
+            tokens = OrderedDict(tokens)
+        self.set = RESet(tokens, flags)
+        self.skip = frozenset(skip)
+        self.error_token = error_token
+
+    def tokenize(self, text):
+        """
+        Args:
+            text (str): the text to split into tokens
+        Yields:
+            Token: each token, in order
+        Raises:
+            LexError: if error_token is None and some text matches no
+                token type
+        """
+        type_for_group = self.set.label_for_group
+        skip = self.skip
+        error_token = self.error_token
+        position = 0
+
+        for match in self.set.compiled.finditer(text):
+            start, end = match.span()
+            if start == end:
+                # A token pattern that matches the empty string cannot
+                # advance the scan, so its matches are ignored
+                continue
+
+            if start != position:
+                # finditer passed over text that no token matched
+                if error_token is None:
+                    raise LexError(
+                        "No token matches the input at offset %d" % position,
+                        position
+                    )
+                yield Token(error_token, text[position:start], position)
+
+            kind = type_for_group(match.lastindex)
+            if kind not in skip:
+                yield Token(kind, match.group(), start)
+            position = end
+
+        if position != len(text):
+            if error_token is None:
+                raise LexError(
+                    "No token matches the input at offset %d" % position,
+                    position
+                )
+            yield Token(error_token, text[position:], position)
+
+    def __call__(self, text):
+        """
+        Returns:
+            list: all the tokens in text
+        """
+        return list(self.tokenize(text))
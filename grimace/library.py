@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+"""
+Export a module of named RE definitions to a precomputed pattern library,
+and load such a library without rebuilding the REs.
+
+Building REs through long fluent chains at import time costs startup time
+in short-lived processes.  A library holds only the finished pattern
+strings, with their flags and group names, and compiles each pattern the
+first time it is used:
+
+    python -m grimace.library myapp.patterns patterns.json
+    python -m grimace.library myapp.patterns patterns_gen.py
+    python -m grimace.library --check myapp.patterns patterns.json
+
+A .py output is a generated module whose `library` attribute is the
+loaded Library; anything else is written as JSON, to be read with
+load_library().  With --check, the file is compared with the definitions
+and the exit status is 1 if they differ.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import argparse
+import importlib
+import io
+import json
+import pprint
+import sys
+from nine import str
+from . import instrument
+from .elements import RE
+
+# Version of the library file layout
+FORMAT = 1
+
+
+def collect(module):
+    """
+    Args:
+        module: a module (or any object) whose public attributes include
+            RE definitions, or a mapping of name to RE
+    Returns:
+        dict: name to RE for each RE found
+    """
+    if hasattr(module, 'items'):
+        items = module.items()
+    else:
+        items = ((name, getattr(module, name)) for name in dir(module)
+                 if not name.startswith('_'))
+    return dict((name, value) for name, value in items
+                if isinstance(value, RE))
+
+
+def entries_for(definitions, flags=None):
+    """
+    Build the library entries for some RE definitions.  Each pattern is
+    compiled once here, to validate it and to record its groups.
+
+    Args:
+        definitions: a module or mapping, as for collect()
+        flags (dict): optional mapping of name to the flags that pattern
+            should be compiled with (default 0)
+    Returns:
+        dict: name to a dict of pattern, flags, groups and groupindex
+    """
+    flags = flags or {}
+    entries = {}
+    for name, definition in sorted(collect(definitions).items()):
+        pattern_flags = int(flags.get(name, 0))
+        compiled = definition.as_re(pattern_flags)
+        entries[name] = {
+            'pattern': definition.as_string(),
+            'flags': pattern_flags,
+            'groups': compiled.groups,
+            'groupindex': dict(compiled.groupindex),
+        }
+    return entries
+
+
+class Library(object):
+    """
+    A set of named, precomputed patterns.  Nothing is compiled until a
+    pattern is first used; compiled objects come from the shared RE.cache
+    and are then remembered by the library.
+
+    Patterns may be looked up as library['name'] or library.name, both
+    of which return the compiled regexp object.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries (dict): name to entry, as built by entries_for()
+        """
+        self._entries = entries
+        self._compiled = {}
+
+    def names(self):
+        """
+        Returns:
+            list: the pattern names, sorted
+        """
+        return sorted(self._entries)
+
+    def pattern(self, name):
+        """
+        Returns:
+            str: the pattern string for name, without compiling it
+        """
+        return self._entries[name]['pattern']
+
+    def flags(self, name):
+        """
+        Returns:
+            int: the flags the pattern for name is compiled with
+        """
+        return self._entries[name]['flags']
+
+    def groupindex(self, name):
+        """
+        Returns:
+            dict: group name to group number for the pattern, without
+                compiling it
+        """
+        return dict(self._entries[name]['groupindex'])
+
+    def compile(self, name):
+        """
+        Returns:
+            re.RegexObject: the compiled pattern for name, compiling it
+                on first use
+        Raises:
+            KeyError: if there is no pattern called name
+        """
+        compiled = self._compiled.get(name)
+        if compiled is None:
+            entry = self._entries[name]
+            compiled = self._compiled[name] = RE.cache.compile(
+                entry['pattern'], entry['flags'])
+        return compiled if instrument.active is None else \
+            instrument.active.wrap(compiled)
+
+    def __getitem__(self, name):
+        return self.compile(name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.compile(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def verify(self, definitions, flags=None):
+        """
+        Compare the library with the RE definitions it was built from.
+
+        Args:
+            definitions: a module or mapping, as for collect()
+            flags (dict): the flags mapping the library was built with
+        Returns:
+            list: the names that are missing from the library, missing
+                from the definitions, or whose entries differ; empty if
+                the library is up to date
+        """
+        expected = entries_for(definitions, flags)
+        names = set(expected) | set(self._entries)
+        return sorted(name for name in names
+                      if expected.get(name) != self._entries.get(name))
+
+    def to_json(self):
+        """
+        Returns:
+            str: the library as a JSON document, for load_library()
+        """
+        return json.dumps({'format': FORMAT, 'patterns': self._entries},
+                          indent=2, sort_keys=True)
+
+    def to_module(self):
+        """
+        Returns:
+            str: the source of a Python module whose `library` attribute
+                is this library
+        """
+        return '\n'.join((
+            '# -*- coding: utf-8 -*-',
+            '# Generated by grimace.library - do not edit.',
+            '',
+            'from __future__ import unicode_literals',
+            'from grimace.library import Library',
+            '',
+            'library = Library(%s)' % pprint.pformat(self._entries),
+            '',
+        ))
+
+
+def build_library(definitions, flags=None):
+    """
+    Args:
+        definitions: a module or mapping, as for collect()
+        flags (dict): optional mapping of name to flags
+    Returns:
+        Library: a library of the definitions
+    """
+    return Library(entries_for(definitions, flags))
+
+
+def export_library(definitions, path, flags=None):
+    """
+    Write a library of the definitions to path: a generated Python module
+    if path ends in .py, otherwise JSON.
+
+    Args:
+        definitions: a module or mapping, as for collect()
+        path (str): the file to write
+        flags (dict): optional mapping of name to flags
+    Returns:
+        Library: the library that was written
+    """
+    library = build_library(definitions, flags)
+    text = library.to_module() if path.endswith('.py') else \
+        library.to_json()
+    with io.open(path, 'w', encoding='utf-8') as stream:
+        stream.write(str(text))
+    return library
+
+
+def load_library(path):
+    """
+    Read a library written as JSON by export_library().  No RE objects
+    are built and nothing is compiled.
+
+    Args:
+        path (str): the JSON file
+    Returns:
+        Library
+    Raises:
+        ValueError: if the file is not a library of a known format
+    """
+    with io.open(path, encoding='utf-8') as stream:
+        document = json.load(stream)
+    if document.get('format') != FORMAT:
+        raise ValueError("%s is not a grimace pattern library" % path)
+    return Library(document['patterns'])
+
+
+def _load_any(path):
+    """
+    Returns:
+        Library: the library in path, which may be JSON or a generated
+            module
+    """
+    if not path.endswith('.py'):
+        return load_library(path)
+    namespace = {}
+    with io.open(path, encoding='utf-8') as stream:
+        exec(compile(stream.read(), path, 'exec'), namespace)
+    return namespace['library']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m grimace.library')
+    parser.add_argument('module',
+                        help='dotted name of the module defining the REs')
+    parser.add_argument('output', help='the library file (.py or .json)')
+    parser.add_argument('--check', action='store_true',
+                        help='verify the file rather than writing it')
+    args = parser.parse_args(argv)
+
+    definitions = importlib.import_module(args.module)
+    if not args.check:
+        library = export_library(definitions, args.output)
+        print("Wrote %d patterns to %s" % (len(library), args.output))
+        return 0
+
+    stale = _load_any(args.output).verify(definitions)
+    for name in stale:
+        print("%s: differs from the definition" % name)
+    return 1 if stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+An optional pass over an RE's elements that makes the regexp shorter
+without changing what it matches, or the numbering and names of its
+groups:
+
+- runs of the same single-character atom are collapsed, so
+  digit.digit.digit gives \\d{3}
+- redundant repeats are dropped or shortened, so a {1,1} from a, an or
+  one disappears and {3,3} becomes {3}
+- an alternation that makes up a whole group (or the whole regexp) has
+  the prefix shared by all its alternatives factored out, so
+  any_re('foobar', 'foobaz') gives fooba(?:r|z)
+- adjacent strings are merged into one element
+
+The pass works on the regexp text between group elements, which it
+tokenizes.  If it meets text it does not understand (unbalanced
+parentheses split across elements, or inline flags such as (?x), which
+change how the text is read), it returns the elements unchanged.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import re
+from collections import namedtuple
+from nine import basestring, str
+from .elements import PostfixGeneratingREElement, StartGroup, EndGroup
+
+Token = namedtuple('Token', ('atom', 'quantifier', 'kind'))
+"""
+One atom of regexp text with its quantifier.  The kind is 'char' for a
+single (possibly escaped) character, 'class' for a bracketed set or '.',
+'group' for a parenthesized group, 'alt' for a '|' and 'other' for
+anchors and backreferences, which are never collapsed.
+"""
+
+_COUNTED = re.compile(r'\{(\d*)(?:(,)(\d*))?\}')
+_FLAGS = re.compile(r'\(\?[aiLmsux-]')
+_ESCAPE_LENGTHS = {'x': 4, 'u': 6, 'U': 10}
+
+
+class _Unreadable(Exception):
+    """
+    The text cannot be tokenized safely
+    """
+
+
+def _escape_end(text, i):
+    """
+    Returns:
+        tuple: the index just after the escape sequence at i, and its kind
+    """
+    c = text[i + 1:i + 2]
+    if not c:
+        raise _Unreadable()
+    if c in _ESCAPE_LENGTHS:
+        return i + _ESCAPE_LENGTHS[c], 'char'
+    if c == 'N':
+        end = text.find('}', i)
+        if end < 0:
+            raise _Unreadable()
+        return end + 1, 'char'
+    if c == '0':
+        end = i + 2
+        while end < i + 4 and text[end:end + 1] in '01234567' and \
+                text[end:end + 1]:
+            end += 1
+        return end, 'char'
+    if c.isdigit():
+        octal = text[i + 1:i + 4]
+        if len(octal) == 3 and all(d in '01234567' for d in octal):
+            return i + 4, 'char'
+        end = i + 2
+        if text[end:end + 1].isdigit():
+            end += 1
+        return end, 'other'
+    if c in 'bBAZ':
+        return i + 2, 'other'
+    return i + 2, 'char'
+
+
+def _class_end(text, i):
+    """
+    Returns:
+        int: the index just after the bracketed set starting at i
+    """
+    j = i + 1
+    if text[j:j + 1] == '^':
+        j += 1
+    if text[j:j + 1] == ']':
+        j += 1
+    while j < len(text):
+        c = text[j]
+        if c == '\\':
+            j += 2
+        elif c == ']':
+            return j + 1
+        else:
+            j += 1
+    raise _Unreadable()
+
+
+def _group_end(text, i):
+    """
+    Returns:
+        int: the index just after the group starting at i
+    """
+    if _FLAGS.match(text, i):
+        raise _Unreadable()
+    depth = 0
+    j = i
+    while j < len(text):
+        c = text[j]
+        if c == '\\':
+            j += 2
+            continue
+        if c == '[':
+            j = _class_end(text, j)
+            continue
+        if c == '(':
+            if _FLAGS.match(text, j):
+                raise _Unreadable()
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if not depth:
+                return j + 1
+        j += 1
+    raise _Unreadable()
+
+
+def _quantifier_end(text, i):
+    """
+    Returns:
+        int: the index just after any quantifier starting at i
+    """
+    c = text[i:i + 1]
+    if c and c in '*+?':
+        end = i + 1
+    else:
+        counted = _COUNTED.match(text, i)
+        if counted is None or not (counted.group(1) or counted.group(3)):
+            return i
+        end = counted.end()
+    if text[end:end + 1] in ('?', '+'):
+        end += 1
+    if text[end:end + 1] and text[end] in '*+?' or _COUNTED.match(text, end):
+        # A repeated repeat is left for re to judge
+        raise _Unreadable()
+    return end
+
+
+def tokenize(text):
+    """
+    Args:
+        text (str): regexp text
+    Returns:
+        list: the Tokens of the text
+    Raises:
+        _Unreadable: if the text cannot be tokenized safely
+    """
+    tokens = []
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == '\\':
+            end, kind = _escape_end(text, i)
+        elif c == '[':
+            end, kind = _class_end(text, i), 'class'
+        elif c == '(':
+            end, kind = _group_end(text, i), 'group'
+        elif c == '|':
+            tokens.append(Token(c, '', 'alt'))
+            i += 1
+            continue
+        elif c in ')*+?':
+            raise _Unreadable()
+        elif c in '^$':
+            end, kind = i + 1, 'other'
+        elif c == '.':
+            end, kind = i + 1, 'class'
+        elif c in '{}':
+            end, kind = i + 1, 'other'
+        else:
+            end, kind = i + 1, 'char'
+
+        quantified = _quantifier_end(text, end)
+        tokens.append(Token(text[i:end], text[end:quantified], kind))
+        i = quantified
+    return tokens
+
+
+def _simplified(token):
+    """
+    Returns:
+        Token: the token with an equivalent, shorter quantifier, if there
+            is one
+    """
+    quantifier = token.quantifier
+    if not quantifier.startswith('{'):
+        return token
+    counted = _COUNTED.match(quantifier)
+    suffix = quantifier[counted.end():]
+    minimum, comma, maximum = counted.groups()
+    if comma and minimum == maximum:
+        comma = maximum = None
+    if not comma and minimum == '1' and (
+            not suffix or token.kind in ('char', 'class')):
+        # x{1} is x, and a possessive single character is no different
+        return token._replace(quantifier='')
+    if not comma:
+        quantifier = '{%s}' % minimum
+    elif minimum in ('', '0') and maximum == '1':
+        quantifier = '?'
+    elif minimum in ('', '0') and not maximum:
+        quantifier = '*'
+    elif minimum == '1' and not maximum:
+        quantifier = '+'
+    else:
+        return token
+    return token._replace(quantifier=quantifier + suffix)
+
+
+def _collapsed(tokens):
+    """
+    Returns:
+        list: the tokens with each run of the same unquantified
+            character or class written once with a count, where that is
+            shorter
+    """
+    result = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        j = i + 1
+        if token.kind in ('char', 'class') and not token.quantifier:
+            while j < len(tokens) and tokens[j] == token:
+                j += 1
+        count = j - i
+        counted = '{%d}' % count
+        if count > 1 and len(token.atom) + len(counted) < \
+                len(token.atom) * count:
+            result.append(token._replace(quantifier=counted))
+        else:
+            result.extend(tokens[i:j])
+        i = j
+    return result
+
+
+def _factored(tokens):
+    """
+    Returns:
+        list: the tokens, with the prefix shared by all alternatives (if
+            the tokens are an alternation) moved out in front of a
+            non-capturing group, where that is shorter
+    """
+    alternatives = [[]]
+    for token in tokens:
+        if token.kind == 'alt':
+            alternatives.append([])
+        else:
+            alternatives[-1].append(token)
+    if len(alternatives) < 2:
+        return tokens
+
+    shared = 0
+    shortest = min(len(a) for a in alternatives)
+    while shared < shortest and \
+            all(a[shared] == alternatives[0][shared] for a in alternatives):
+        shared += 1
+    if not shared:
+        return tokens
+
+    prefix = alternatives[0][:shared]
+    rest = '(?:%s)' % '|'.join(_text(a[shared:]) for a in alternatives)
+    if len(_text(prefix)) + len(rest) >= len(_text(tokens)):
+        return tokens
+    return prefix + [Token(rest, '', 'group')]
+
+
+def _text(tokens):
+    return ''.join(token.atom + token.quantifier for token in tokens)
+
+
+def _segments(elements):
+    """
+    Apply each repeat to the text or group element it modifies, in the
+    same way as stringifying the RE, and join up adjacent text.
+
+    Returns:
+        list: strings of text, and (repeater, element) pairs for group
+            elements, where repeater may be None
+    """
+    segments = []
+    pending = None
+    for e in elements:
+        if isinstance(e, PostfixGeneratingREElement):
+            pending = e
+            continue
+        if isinstance(e, basestring):
+            text = e if isinstance(e, str) else e.decode('ascii')
+        elif isinstance(e, (StartGroup, EndGroup)):
+            segments.append((pending, e))
+            pending = None
+            continue
+        else:
+            text = e.marker()
+        if not text:
+            continue
+        if pending is not None:
+            text += pending.postfix_marker()
+            pending = None
+        if segments and isinstance(segments[-1], basestring):
+            segments[-1] += text
+        else:
+            segments.append(text)
+    return segments
+
+
+def optimize(elements):
+    """
+    Args:
+        elements (list): the elements of a valid RE
+    Returns:
+        list: equivalent elements making a shorter regexp, or elements
+            unchanged if the regexp uses constructs the pass does not
+            understand
+    """
+    segments = _segments(elements)
+    optimized = []
+    for index, segment in enumerate(segments):
+        if not isinstance(segment, basestring):
+            repeater, element = segment
+            if repeater is not None:
+                optimized.append(repeater)
+            optimized.append(element)
+            continue
+
+        try:
+            tokens = [_simplified(t) for t in tokenize(segment)]
+        except _Unreadable:
+            return list(elements)
+
+        # Only an alternation that is a whole group, or the whole
+        # regexp, can be factored, since text on either side of it would
+        # otherwise join its first or last alternative.
+        before = segments[index - 1] if index else None
+        after = segments[index + 1] if index + 1 < len(segments) else None
+        if (before is None or before[0] is None and
+                isinstance(before[1], StartGroup)) and \
+                (after is None or isinstance(after[1], EndGroup)):
+            tokens = _factored(tokens)
+        optimized.append(_text(_collapsed(tokens)))
+    return optimized
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+"""
+Searching large inputs in parallel, by splitting them into chunks that
+are scanned by a pool of worker processes.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+import re
+from collections import deque, namedtuple
+from nine import basestring, range, zip
+from . import analysis, files
+
+ChunkMatch = namedtuple('ChunkMatch', ('start', 'end', 'text', 'groups'))
+"""
+A match found by parallel_finditer: its start and end offsets in the
+input, the matched bytes, and the match's groups.  Unlike a match
+object, it can be returned from a worker process.
+"""
+
+DEFAULT_CHUNK_SIZE = 1 << 24
+
+# The compiled pattern and (for a file) the map that a worker process
+# scans, set by _init_worker when the pool for one call starts, so
+# nothing outlives that pool.
+_worker_compiled = None
+_worker_buffer = None
+
+
+def _init_worker(pattern, flags, path):
+    """
+    Pool initializer: compile the pattern, and map the file if the
+    input is a file, once per worker process.
+    """
+    global _worker_compiled, _worker_buffer
+    _worker_compiled = re.compile(pattern, flags)
+    _worker_buffer = files.map_file(path) if path is not None else None
+
+
+def _scan(compiled, buffer, start, end, endpos, base=0):
+    """
+    Returns:
+        list of ChunkMatch: the matches of compiled in buffer that start
+            in [start, end), scanning from start up to endpos.  Offsets
+            are in the whole input, of which buffer begins at base.
+    """
+    results = []
+    for match in compiled.finditer(buffer, start - base, endpos - base):
+        match_start = match.start() + base
+        if match_start >= end:
+            break
+        results.append(ChunkMatch(match_start, match.end() + base,
+                                  match.group(), match.groups()))
+    return results
+
+
+def _scan_chunk(task):
+    """
+    Scan one chunk in a worker process.
+
+    Args:
+        task (tuple): (slice, start, end, endpos, base), where slice is
+            the bytes to scan, or None to scan the worker's mapped file
+    Returns:
+        list of ChunkMatch
+    """
+    data, start, end, endpos, base = task
+    buffer = _worker_buffer if data is None else data
+    return _scan(_worker_compiled, buffer, start, end, endpos, base)
+
+
+def _line_aligned(buffer, offsets, size):
+    """
+    Returns:
+        list: the chunk boundary offsets, each moved forward to just
+            after the next newline (dropping any that coincide)
+    """
+    aligned = [0]
+    for offset in offsets[1:]:
+        newline = buffer.find(b'\n', max(offset, aligned[-1]) - 1)
+        boundary = size if newline < 0 else newline + 1
+        if boundary > aligned[-1]:
+            aligned.append(boundary)
+    if aligned[-1] != size:
+        aligned.append(size)
+    return aligned
+
+
+def _resynchronized(compiled, buffer, chunk, results, last_end):
+    """
+    Correct the results of a chunk whose scan began part-way through
+    the previous chunk's last match.  A sequential scan would resume at
+    last_end, so scan from there until a match coincides with one the
+    chunk found; from then on the two scans are in step, and the rest of
+    the chunk's results can be used as they are.
+
+    Yields:
+        ChunkMatch
+    """
+    start, end, endpos = chunk
+    found = dict(((r.start, r.end), i) for i, r in enumerate(results))
+    for match in compiled.finditer(buffer, last_end, endpos):
+        if match.start() >= end:
+            return
+        index = found.get(match.span())
+        if index is not None:
+            for result in results[index:]:
+                yield result
+            return
+        yield ChunkMatch(match.start(), match.end(), match.group(),
+                         match.groups())
+
+
+def parallel_finditer(pattern, source, flags=0, workers=None,
+                      chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Find all matches of a bytes pattern in source, using a pool of
+    worker processes.
+
+    If the pattern can only match text of bounded length, each chunk is
+    scanned past its end by that length (plus the reach of any lookahead
+    assertions), so that matches which straddle a boundary are found.
+    Otherwise, chunk boundaries are moved to line starts and chunks do
+    not overlap, which assumes that matches do not span lines.
+
+    Results are merged in offset order.  Where a chunk's scan began
+    part-way through the previous chunk's last match, its results are
+    resynchronized by rescanning (in this process) from the end of that
+    match, until the rescan meets a match the chunk also found.  So the
+    results are those of a sequential finditer.
+
+    Chunks are submitted to the pool a few at a time, so at most a few
+    chunks of an in-memory source are copied at once; a file is mapped
+    by each worker rather than copied.
+
+    Args:
+        pattern (bytes): the regexp
+        source: a file path, or a bytes, bytearray or mmap object
+        flags (int): flags to compile the pattern with
+        workers (int): the number of worker processes, defaulting to
+            the number of CPUs.  With one worker, the scan is done in
+            this process.
+        chunk_size (int): the size of each chunk in bytes
+    Yields:
+        ChunkMatch
+    """
+    path = source if isinstance(source, basestring) else None
+    if path is not None:
+        buffer = files.map_file(path)
+        if buffer is None:
+            return
+    else:
+        buffer = source
+    size = len(buffer)
+    compiled = re.compile(pattern, flags)
+
+    overlap = analysis.width(pattern, flags)[1]
+    behind, ahead = analysis.lookaround_widths(pattern, flags)
+    if overlap is not None:
+        overlap = None if ahead is None else overlap + ahead
+    # Context shipped before an in-memory chunk, so that word boundaries
+    # and lookbehinds see the right characters
+    context = max(1, behind) if behind is not None else chunk_size
+
+    boundaries = list(range(0, size, max(1, chunk_size))) + [size]
+    if overlap is None:
+        boundaries = _line_aligned(buffer, boundaries, size)
+
+    chunks = []
+    for start, end in zip(boundaries, boundaries[1:]):
+        # Scanning one byte beyond the overlap means that a match could
+        # only end at endpos (where '$' would wrongly succeed) if it were
+        # longer than the pattern allows.
+        if overlap is None:
+            endpos = end
+        else:
+            endpos = min(size, end + overlap + 1)
+        chunks.append((start, end, endpos))
+
+    if workers is None:
+        # Imported here so that importing grimace does not pay for it
+        import multiprocessing
+        workers = multiprocessing.cpu_count()
+
+    if workers <= 1 or len(chunks) <= 1:
+        scanned = (_scan(compiled, buffer, *chunk) for chunk in chunks)
+    else:
+        scanned = _pooled(pattern, flags, path, buffer, chunks, workers,
+                          context)
+
+    last_end = None
+    for chunk, results in zip(chunks, scanned):
+        if results and last_end is not None and results[0].start < last_end:
+            results = _resynchronized(compiled, buffer, chunk, results,
+                                      last_end)
+        for result in results:
+            last_end = result.end
+            yield result
+
+
+def _pooled(pattern, flags, path, buffer, chunks, workers, context):
+    """
+    Scan the chunks in a pool of workers, keeping only a bounded number
+    of chunks in flight.
+
+    Yields:
+        list of ChunkMatch: the results for each chunk, in order
+    """
+    import multiprocessing
+
+    def tasks():
+        for start, end, endpos in chunks:
+            if path is not None:
+                yield None, start, end, endpos, 0
+            else:
+                base = max(0, start - context)
+                yield bytes(buffer[base:endpos]), start, end, endpos, base
+
+    pool = multiprocessing.Pool(workers, _init_worker, (pattern, flags, path))
+    try:
+        pending = deque()
+        for task in tasks():
+            pending.append(pool.apply_async(_scan_chunk, (task,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from . import analysis
+
+
+class PrefilteredMatcher(object):
+    """
+    Wraps a compiled regexp with a cheap check on a literal substring
+    that every match must contain, so that the regexp only runs on
+    candidate strings.  If the pattern is anchored by a literal prefix,
+    that is checked with startswith instead.  If the pattern has no
+    required literal, every string is a candidate.
+
+    Attributes:
+        compiled: the compiled regexp
+        literal: the required substring checked, or None
+        prefix: the required prefix checked, or None
+        calls (int): the number of strings tested
+        candidates (int): the number that passed the prefilter
+        matches (int): the number that the regexp matched
+    """
+
+    def __init__(self, compiled):
+        """
+        Args:
+            compiled: a compiled str or bytes regexp
+        """
+        self.compiled = compiled
+        literals, self.prefix = analysis.required_literals(
+            compiled.pattern, compiled.flags
+        )
+        # The longest literal is usually the most selective
+        self.literal = max(literals, key=len) if literals else None
+        self.calls = self.candidates = self.matches = 0
+
+    def _candidate(self, string):
+        """
+        Returns:
+            bool: True if string passes the prefilter
+        """
+        self.calls += 1
+        if self.prefix is not None:
+            passed = string.startswith(self.prefix)
+        elif self.literal is not None:
+            passed = self.literal in string
+        else:
+            passed = True
+        if passed:
+            self.candidates += 1
+        return passed
+
+    def search(self, string):
+        """
+        As for compiled.search, but only run on candidate strings
+        Returns:
+            match object, or None
+        """
+        if not self._candidate(string):
+            return None
+        match = self.compiled.search(string)
+        if match is not None:
+            self.matches += 1
+        return match
+
+    def match(self, string):
+        """
+        As for compiled.match, but only run on candidate strings
+        Returns:
+            match object, or None
+        """
+        if not self._candidate(string):
+            return None
+        match = self.compiled.match(string)
+        if match is not None:
+            self.matches += 1
+        return match
+
+    def filter(self, strings):
+        """
+        Search each of the strings, checking the prefilter in a single
+        expression per string, and yield the successful matches.
+        Yields:
+            match objects
+        """
+        search = self.compiled.search
+        prefix, literal = self.prefix, self.literal
+        calls = candidates = matches = 0
+        try:
+            for string in strings:
+                calls += 1
+                if prefix is not None:
+                    if not string.startswith(prefix):
+                        continue
+                elif literal is not None and literal not in string:
+                    continue
+                candidates += 1
+                match = search(string)
+                if match is not None:
+                    matches += 1
+                    yield match
+        finally:
+            self.calls += calls
+            self.candidates += candidates
+            self.matches += matches
+
+    def stats(self):
+        """
+        Returns:
+            dict: the counters, plus the selectivity (the fraction of
+                strings that passed the prefilter) and the precision
+                (the fraction of candidates that matched)
+        """
+        return {
+            'literal': self.literal,
+            'prefix': self.prefix,
+            'calls': self.calls,
+            'candidates': self.candidates,
+            'matches': self.matches,
+            'selectivity': (self.candidates / self.calls
+                            if self.calls else None),
+            'precision': (self.matches / self.candidates
+                          if self.candidates else None),
+        }
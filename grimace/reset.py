@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from nine import integer_types, range
+from .elements import RE, StartGroup, FormatError
+
+
+class RESetMatch(object):
+    """
+    The result of matching an RESet: which member matched, and that
+    member's groups, numbered and named as they are in the member RE.
+
+    Attributes:
+        index (int): the position of the matching member in the set
+        label: the label of the matching member (its index if the set
+            was built from a sequence)
+        re (RE): the matching member
+        match: the underlying match object for the combined pattern
+    """
+
+    __slots__ = ('index', 'label', 're', 'match', '_offset', '_names',
+                 '_count')
+
+    def __init__(self, index, label, member, match, offset, names, count):
+        self.index = index
+        self.label = label
+        self.re = member
+        self.match = match
+        self._offset = offset
+        self._names = names
+        self._count = count
+
+    def _group_number(self, group):
+        """
+        Returns:
+            int: the combined-pattern group number for the member's group,
+                which may be a number or a name
+        """
+        if group in self._names:
+            return self._names[group]
+        if not isinstance(group, integer_types) or \
+                not 0 <= group <= self._count:
+            raise IndexError("no such group")
+        return self._offset + group
+
+    def group(self, *groups):
+        """
+        As for match.group(), with the member's group numbers and names
+        """
+        if not groups:
+            groups = (0,)
+        values = tuple(
+            self.match.group(self._group_number(g)) for g in groups
+        )
+        return values[0] if len(values) == 1 else values
+
+    def groups(self, default=None):
+        """
+        As for match.groups(), for the member's groups only
+        """
+        values = self.match.group
+        return tuple(
+            default if value is None else value
+            for value in (
+                values(self._offset + i) for i in range(1, self._count + 1)
+            )
+        )
+
+    def groupdict(self, default=None):
+        """
+        As for match.groupdict(), with the member's group names
+        """
+        result = {}
+        for name, number in self._names.items():
+            value = self.match.group(number)
+            result[name] = value if value is not None else default
+        return result
+
+    def start(self, group=0):
+        return self.match.start(self._group_number(group))
+
+    def end(self, group=0):
+        return self.match.end(self._group_number(group))
+
+    def span(self, group=0):
+        return self.match.span(self._group_number(group))
+
+
+class RESet(object):
+    """
+    A set of REs that are matched together in a single scan.  The member
+    REs are combined into one alternation, each wrapped in a generated
+    named group, and the result of a match reports which member matched.
+
+    Group names in the members are rewritten so that they do not collide
+    in the combined pattern; RESetMatch maps them back.  Groups inside
+    strings added with regex() are numbered correctly, but named groups
+    or backreferences written in such strings are not rewritten.
+
+    Where more than one member could match at the same position, the
+    earliest member in the set wins, as for any alternation.
+
+    Attributes:
+        labels (list): the member labels, in order
+        members (list): the member REs, in order
+        re (RE): the combined alternation
+        compiled: the compiled regexp object for the combined pattern
+    """
+
+    def __init__(self, members, flags=0):
+        """
+        Args:
+            members: a sequence of RE objects, or a mapping of label to
+                RE (use an ordered mapping to control precedence)
+            flags (int): flags passed to as_re() for the combined pattern
+        """
+        if hasattr(members, 'items'):
+            labelled = list(members.items())
+        else:
+            labelled = list(enumerate(members))
+        if not labelled:
+            raise FormatError("An RESet needs at least one member")
+
+        self.labels = [label for label, _ in labelled]
+        self.members = [member for _, member in labelled]
+        self.flags = flags
+
+        wrapped = [
+            RE(StartGroup(name=self._wrapper_name(i)),
+               self._renamed(i, member)).end_group
+            for i, member in enumerate(self.members)
+        ]
+        self.re = RE().any_re(*wrapped)
+        self.compiled = compiled = self.re.as_re(flags)
+
+        # For each member, note where its groups start in the combined
+        # pattern, and map its group names to combined group numbers.
+        # The wrapper group closes last, so match.lastindex identifies the
+        # member that matched.
+        self._dispatch = {}
+        self._labels_by_group = {}
+        for i, member in enumerate(self.members):
+            member_re = member.as_re(flags)
+            offset = compiled.groupindex[self._wrapper_name(i)]
+            names = dict(
+                (name, offset + number)
+                for name, number in member_re.groupindex.items()
+            )
+            self._dispatch[offset] = (i, offset, names, member_re.groups)
+            self._labels_by_group[offset] = self.labels[i]
+
+    def label_for_group(self, index):
+        """
+        Args:
+            index (int): the lastindex of a match of the combined pattern
+        Returns:
+            the label of the member whose wrapper group that is
+        Raises:
+            KeyError: if index is not a member's wrapper group
+        """
+        return self._labels_by_group[index]
+
+    @staticmethod
+    def _wrapper_name(index):
+        return '_m%d' % index
+
+    @staticmethod
+    def _renamed(index, member):
+        """
+        Returns:
+            list: the member's elements with its group names prefixed to
+                be unique within the set
+        """
+        prefix = RESet._wrapper_name(index) + '_'
+        return [
+            StartGroup(name=prefix + e.group_name)
+            if isinstance(e, StartGroup) and e.group_name else e
+            for e in member.elements
+        ]
+
+    def _result(self, match):
+        """
+        Returns:
+            RESetMatch: the result for a match of the combined pattern, or
+                None if match is None
+        """
+        if match is None:
+            return None
+        index, offset, names, count = self._dispatch[match.lastindex]
+        return RESetMatch(index, self.labels[index], self.members[index],
+                          match, offset, names, count)
+
+    def match(self, string, *args):
+        """
+        Match the set at the start of string.  Optional pos and endpos
+        arguments are passed on as for a compiled regexp.
+        Returns:
+            RESetMatch: or None if no member matched
+        """
+        return self._result(self.compiled.match(string, *args))
+
+    def search(self, string, *args):
+        """
+        Search string for the first match of any member.
+        Returns:
+            RESetMatch: or None if no member matched
+        """
+        return self._result(self.compiled.search(string, *args))
+
+    def finditer(self, string, *args):
+        """
+        Yields:
+            RESetMatch: for each non-overlapping match of any member
+        """
+        result = self._result
+        for match in self.compiled.finditer(string, *args):
+            yield result(match)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __str__(self):
+        return self.re.as_string()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Matching a stream that arrives in arbitrary chunks, such as socket or
+pipe input, without buffering all of it.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+from collections import namedtuple
+from . import analysis
+
+StreamMatch = namedtuple('StreamMatch', ('start', 'end', 'text', 'groups'))
+"""
+A match found by a StreamMatcher: its start and end offsets in the whole
+stream, the matched text and the match's groups.
+"""
+
+# The longest match assumed for a pattern with no maximum length
+DEFAULT_LIMIT = 1 << 16
+
+
+class StreamMatcher(object):
+    """
+    Finds the matches of an RE in a stream fed to it in chunks, giving
+    the same matches as finditer() over the whole stream would.
+
+    A match is emitted by feed() as soon as no further input could
+    change it.  Only the tail of the input that a match still in
+    progress could use is kept: the RE's maximum match length plus the
+    reach of any lookahead, and the reach of any lookbehind before that,
+    so memory is constant however long the stream is.
+
+    For an RE with no maximum match length (one using one_or_more, for
+    instance) limit is used instead.  A match that would be longer than
+    limit may then be cut short, at whatever was buffered when it became
+    final, and the rest of the stream is matched from where it ended.
+    """
+
+    def __init__(self, r, flags=0, limit=DEFAULT_LIMIT):
+        """
+        Args:
+            r (RE): the RE to match
+            flags (int): flags passed to as_re() or as_bytes_re()
+            limit (int): the longest match (or lookahead) assumed where
+                the RE does not bound it
+        """
+        self.re = r
+        self.flags = flags
+        self.limit = limit
+        maximum = r.max_length()
+        behind, ahead = analysis.lookaround_widths(str(r), flags)
+        self._ahead = limit if ahead is None else ahead
+        self._maximum = limit if maximum is None else maximum
+        # Keep at least one character before the scan position, so that
+        # \b and lookbehinds see it, and ^ does not match there
+        self._behind = max(1, behind or 0)
+
+        self._compiled = None
+        self._buffer = None
+        self._base = 0      # the stream offset of _buffer[0]
+        self._position = 0  # the stream offset the next scan starts at
+        self._empty_at = None  # offset of the last emitted empty match
+        self._closed = False
+
+    def feed(self, chunk):
+        """
+        Add the next chunk of the stream.  All chunks must be str, or all
+        must be bytes.
+
+        Args:
+            chunk (str or bytes): the next part of the stream
+        Returns:
+            list of StreamMatch: the matches that are now final, in order
+        Raises:
+            ValueError: if the matcher has been closed
+        """
+        if self._closed:
+            raise ValueError("The stream matcher has been closed")
+        if self._buffer is None:
+            binary = isinstance(chunk, (bytes, bytearray))
+            self._compiled = self.re.as_bytes_re(self.flags) if binary \
+                else self.re.as_re(self.flags)
+            self._buffer = chunk[:0]
+        self._buffer += chunk
+        return self._scan(final=False)
+
+    def close(self):
+        """
+        Mark the end of the stream.
+        Returns:
+            list of StreamMatch: the remaining matches, in order
+        """
+        if self._closed:
+            return []
+        if self._buffer is None:
+            # An empty stream, taken to be text
+            self._compiled = self.re.as_re(self.flags)
+            self._buffer = ''
+        results = self._scan(final=True)
+        self._closed = True
+        self._buffer = self._buffer[:0]
+        return results
+
+    def _scan(self, final):
+        """
+        Find the matches that are final, and drop the text that no later
+        match can use.
+        Returns:
+            list of StreamMatch
+        """
+        buffer = self._buffer
+        base = self._base
+        size = len(buffer)
+        # A match, or an attempt to match, starting at or before horizon
+        # sees only text that is already buffered (including the
+        # character after it, for $ and \b)
+        horizon = size - self._maximum - self._ahead - 1
+
+        results = []
+        position = self._position - base
+        for match in self._compiled.finditer(buffer, position):
+            start, end = match.span()
+            if not final:
+                if start > horizon:
+                    # Every attempt up to the horizon has failed
+                    position = max(position, horizon + 1)
+                    break
+            if start == end and start + base == self._empty_at:
+                # Restarting the scan finds the last empty match again
+                continue
+            results.append(StreamMatch(start + base, end + base,
+                                       match.group(), match.groups()))
+            position = end
+            self._empty_at = end + base if start == end else None
+        else:
+            if not final:
+                position = max(position, horizon + 1)
+        self._position = position + base
+
+        # Keep the text before the scan position that lookbehinds and \b
+        # may look at
+        keep = max(0, position - self._behind)
+        if keep:
+            self._buffer = buffer[keep:]
+            self._base = base + keep
+        return results
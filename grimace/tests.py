@@ -2,10 +2,14 @@
 
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
+import os
 import re
+import sys
 import unittest
 from nine import str
-from grimace import RE, FormatError
+from grimace import (RE, CharClass, FormatError, PatternCache, RESet, Lexer, LexError,
+                     Token, REBuilder, instrument)
+from grimace.library import build_library, export_library, load_library
 
 
 class BaseTests(unittest.TestCase):
@@ -30,11 +34,11 @@ class SimpleTests(unittest.TestCase):
         self.assertEqual(RE().start.zero_or_more.of.any_character.end.as_string(),
                          r'^.*$')
 
-        self.assertEqual(RE().any_of("abcdef").as_string(), r"[abcdef]")
+        self.assertEqual(RE().any_of("abcdef").as_string(), r"[a-f]")
 
         # Verify that all metacharacters are quoted
         self.assertEqual(RE().any_of(RE.metacharacters).as_string(),
-                         "[%s]" % (RE.backslash + RE.backslash.join(RE.metacharacters)))
+                         r"[\$\(-\+\-\.\?\[-\^\{-\}]")
 
         r = RE().start.end.as_re()
         self.assertTrue(hasattr(r, "match") and hasattr(r, "search"))
@@ -163,3 +167,1051 @@ class Examples(unittest.TestCase):
         number_re = re.compile(north_american_number_re)
         match = number_re.match("(123)-456-7890")
         assert match
+
+
+class SharingTests(unittest.TestCase):
+    def test_extension_shares_parent(self):
+        base = RE().start.literal("ab")
+        r1 = base.digit
+        r2 = base.alpha
+        self.assertEqual(base.elements, ['^', 'ab'])
+        self.assertEqual(r1.elements, ['^', 'ab', r'\d'])
+        self.assertEqual(r2.elements, ['^', 'ab', '[a-zA-Z]'])
+        self.assertEqual(r1.as_string(), r"^ab\d")
+        self.assertEqual(r2.as_string(), r"^ab[a-zA-Z]")
+
+    def test_spliced_res(self):
+        inner = RE().one_or_more.digit
+        r = RE(RE().start, inner, ['x', RE().dot], inner).end
+        self.assertEqual(r.as_string(), r"^\d+x\.\d+$")
+
+    def test_long_chain(self):
+        r = RE()
+        for _ in range(10000):
+            r = r.digit
+        self.assertEqual(len(r.elements), 10000)
+        self.assertEqual(r.as_string(), r"\d" * 10000)
+
+    def test_not_after_splice(self):
+        r = RE(RE().digit, RE().not_a).any_of("ab")
+        self.assertEqual(r.as_string(), r"\d[^ab]")
+
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        self.saved_cache = RE.cache
+        RE.cache = PatternCache(maxsize=2)
+
+    def tearDown(self):
+        RE.cache = self.saved_cache
+
+    def test_instance_memo(self):
+        r = RE().one_or_more.digit
+        compiled = r.as_re()
+        self.assertIs(r.as_re(), compiled)
+        self.assertIsNot(r.as_re(re.IGNORECASE), compiled)
+        self.assertEqual(RE.cache.stats()['misses'], 2)
+        self.assertEqual(RE.cache.stats()['hits'], 0)
+
+    def test_shared_between_instances(self):
+        compiled = RE().one_or_more.digit.as_re()
+        self.assertIs(RE().one_or_more.digit.as_re(), compiled)
+        self.assertEqual(RE.cache.hits, 1)
+        self.assertEqual(RE.cache.misses, 1)
+
+    def test_eviction(self):
+        RE().digit.as_re()
+        RE().alpha.as_re()
+        RE().dot.as_re()
+        self.assertEqual(RE.cache.stats(), {
+            'hits': 0, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2
+        })
+        RE.cache.maxsize = 0
+        self.assertEqual(len(RE.cache), 0)
+        self.assertEqual(RE.cache.evictions, 3)
+        RE().digit.as_re()
+        self.assertEqual(len(RE.cache), 0)
+
+
+class StringifyTests(unittest.TestCase):
+    def test_string_is_remembered(self):
+        r = RE().start.one_or_more.digit.end
+        s = r.as_string()
+        self.assertIs(str(r), s)
+        self.assertIs(r.as_string(), s)
+
+    def test_pending_postfix(self):
+        # Only the last of adjacent repeaters applies, and a trailing
+        # repeater is dropped
+        self.assertEqual(RE().optional.one_or_more.digit.as_string(), r"\d+")
+        self.assertEqual(RE().digit.optional.as_string(), r"\d")
+
+    def test_unbalanced_groups(self):
+        r = RE().group.digit.end_group.end_group.group.digit.end_group
+        self.assertRaises(FormatError, r.as_string)
+        # Errors are not remembered as results
+        self.assertRaises(FormatError, r.as_string)
+
+
+class SlotTests(unittest.TestCase):
+    def test_no_ops_are_the_instance(self):
+        r = RE().digit
+        for name in ('then', 'followed_by', 'of', 'of_a', 'of_an'):
+            self.assertIs(getattr(r, name), r)
+            self.assertIs(getattr(r, name)(), r)
+        self.assertEqual(r.of(RE().dot).as_string(), r"\d\.")
+
+    def test_no_instance_dict_or_self_reference(self):
+        import gc
+        from grimace.elements import Repeater, StartGroup, EndGroup, Not
+        r = RE().one_or_more.digit
+        self.assertFalse(hasattr(r, '__dict__'))
+        self.assertNotIn(r, gc.get_referents(r))
+        for element in (Repeater(), StartGroup(), EndGroup(), Not()):
+            self.assertFalse(hasattr(element, '__dict__'))
+
+
+class InternTests(unittest.TestCase):
+    def test_equal_patterns_share_instance(self):
+        r1 = RE().start.one_or_more.digit.end.intern()
+        r2 = RE(RE().start, RE().one_or_more.digit).end.intern()
+        self.assertIs(r1, r2)
+        self.assertEqual(hash(r1), hash(r2))
+        self.assertTrue(r1.is_interned())
+        self.assertIs(r1.intern(), r1)
+        self.assertEqual(len({r1: 1, r2: 2}), 1)
+        self.assertIs(r2.as_re(), r1.as_re())
+
+    def test_split_literals_share_instance(self):
+        self.assertIs(RE().literal('ab').intern(),
+                      RE().literal('a').literal('b').intern())
+        self.assertIs(RE().digit.literal('-x').intern(),
+                      RE().digit.literal('-').regex('x').intern())
+        self.assertIsNot(RE().one_or_more.literal('ab').intern(),
+                         RE().one_or_more.literal('a').literal('b').intern())
+
+    def test_unclosed_group(self):
+        r = RE().group.digit.intern()
+        self.assertIs(RE().group.digit.intern(), r)
+        self.assertIsNot(RE().group.digit.end_group.intern(), r)
+
+    def test_different_patterns(self):
+        self.assertIsNot(RE().one_or_more.digit.intern(),
+                         RE().non_greedy.one_or_more.digit.intern())
+        self.assertIsNot(RE().named_group("a").digit.end_group.intern(),
+                         RE().named_group("b").digit.end_group.intern())
+
+    def test_uninterned_compare_by_identity(self):
+        r = RE().dot
+        self.assertFalse(r.is_interned())
+        self.assertNotEqual(r, RE().dot.intern())
+
+
+class BatchTests(unittest.TestCase):
+    lines = ["abc 123", "456", "no digits", "7 and 89"]
+
+    def test_match_and_search(self):
+        r = RE().one_or_more.digit
+        matches = r.match_many(self.lines, as_list=True)
+        self.assertEqual([m.group() if m else None for m in matches],
+                         [None, "456", None, "7"])
+        searches = list(r.search_many(iter(self.lines)))
+        self.assertEqual([m.group() if m else None for m in searches],
+                         ["123", "456", None, "7"])
+
+    def test_findall_and_test(self):
+        r = RE().one_or_more.digit
+        self.assertEqual(r.findall_many(self.lines, as_list=True),
+                         [["123"], ["456"], [], ["7", "89"]])
+        self.assertEqual(list(r.test_many(self.lines)),
+                         [True, True, False, True])
+        self.assertEqual(r.test_many(self.lines, search=False, as_list=True),
+                         [False, True, False, True])
+
+    def test_filter(self):
+        r = RE().start.one_or_more.digit
+        self.assertEqual([m.string for m in r.filter_many(self.lines)],
+                         ["456", "7 and 89"])
+
+
+class RESetTests(unittest.TestCase):
+    def setUp(self):
+        from collections import OrderedDict
+        self.set = RESet(OrderedDict([
+            ('number', RE().named_group("value").one_or_more.digit.end_group),
+            ('tagged', RE().group.one_or_more.alpha.end_group
+                       .literal(':').named_group("value").digit.end_group),
+            ('plain', RE().one_or_more.alpha),
+        ]))
+
+    def test_label_for_group(self):
+        labels = [self.set.label_for_group(m.lastindex)
+                  for m in self.set.compiled.finditer("123 ab:4 xyz")]
+        self.assertEqual(labels, ['number', 'tagged', 'plain'])
+        self.assertIs(self.set.compiled, self.set.re.as_re())
+        self.assertRaises(KeyError, self.set.label_for_group, 2)
+
+    def test_dispatch(self):
+        results = list(self.set.finditer("123 ab:4 xyz"))
+        self.assertEqual([m.label for m in results],
+                         ['number', 'tagged', 'plain'])
+        self.assertEqual([m.index for m in results], [0, 1, 2])
+        self.assertEqual([m.group() for m in results], ['123', 'ab:4', 'xyz'])
+
+    def test_member_groups(self):
+        m = self.set.search("-- ab:4")
+        self.assertEqual(m.label, 'tagged')
+        self.assertEqual(m.groups(), ('ab', '4'))
+        self.assertEqual(m.group(1, 'value'), ('ab', '4'))
+        self.assertEqual(m.groupdict(), {'value': '4'})
+        self.assertEqual(m.span('value'), (6, 7))
+        self.assertRaises(IndexError, m.group, 3)
+        self.assertRaises(IndexError, m.group, 'missing')
+
+    def test_no_match(self):
+        self.assertIsNone(self.set.match("-- 123"))
+        self.assertEqual(RESet([RE().digit]).match("1").label, 0)
+
+
+class LexerTests(unittest.TestCase):
+    def setUp(self):
+        self.tokens = [
+            ('number', RE().one_or_more.digit),
+            ('name', RE().identifier),
+            ('op', RE().any_of('+-*/=')),
+            ('space', RE().one_or_more.whitespace),
+        ]
+
+    def test_tokenize(self):
+        lexer = Lexer(self.tokens, skip=['space'])
+        self.assertEqual(lexer("x = 12 + y1"), [
+            Token('name', 'x', 0),
+            Token('op', '=', 2),
+            Token('number', '12', 4),
+            Token('op', '+', 7),
+            Token('name', 'y1', 9),
+        ])
+
+    def test_errors(self):
+        lexer = Lexer(self.tokens, skip=['space'])
+        with self.assertRaises(LexError) as context:
+            lexer("x = $$ 1")
+        self.assertEqual(context.exception.offset, 4)
+        self.assertRaises(LexError, lexer, "x ?")
+
+    def test_error_recovery(self):
+        lexer = Lexer(self.tokens, skip=['space'], error_token='error')
+        self.assertEqual(lexer("x $$ 1?"), [
+            Token('name', 'x', 0),
+            Token('error', '$$', 2),
+            Token('number', '1', 5),
+            Token('error', '?', 6),
+        ])
+
+
+class BytesTests(unittest.TestCase):
+    def test_bytes_pattern(self):
+        r = RE().literal(b"a.b").one_or_more.any_of(b"\xff-").regex(b"\\d")
+        self.assertEqual(r.as_bytes(), b"a\\.b[\\-\xff]+\\d")
+        compiled = r.as_bytes_re()
+        self.assertIs(r.as_bytes_re(), compiled)
+        self.assertIsNot(r.as_re(), compiled)
+        self.assertEqual(compiled.search(b"xa.b\xff-\xff7").group(),
+                         b"a.b\xff-\xff7")
+
+    def test_buffers(self):
+        import mmap
+        compiled = RE().one_or_more.digit.as_bytes_re()
+        self.assertEqual(compiled.search(memoryview(b"ab 42")).group(), b"42")
+        self.assertEqual(compiled.search(bytearray(b"ab 42")).group(), b"42")
+        buffer = mmap.mmap(-1, 16)
+        buffer.write(b"xyz 1234")
+        self.assertEqual(compiled.search(buffer).span(), (4, 8))
+        buffer.close()
+
+    def test_unencodable(self):
+        self.assertRaises(FormatError, RE().literal("€").as_bytes)
+
+
+class FileTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as f:
+            f.write(b"first line\nid=12 and id=345\n\nlast id=6")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_finditer_file(self):
+        r = RE().literal(b"id=").group.one_or_more.digit.end_group
+        self.assertEqual([m.group(1) for m in r.finditer_file(self.path)],
+                         [b"12", b"345", b"6"])
+        self.assertEqual([m.start() for m in r.scan_file(self.path)],
+                         [11, 21, 34])
+
+    def test_line_numbers(self):
+        r = RE().literal("id=").one_or_more.digit
+        self.assertEqual(
+            [(line, m.group())
+             for line, m in r.finditer_file(self.path, line_numbers=True)],
+            [(2, b"id=12"), (2, b"id=345"), (4, b"id=6")]
+        )
+
+    def test_empty_file(self):
+        with open(self.path, 'wb'):
+            pass
+        self.assertEqual(list(RE().digit.finditer_file(self.path)), [])
+
+
+class ParallelTests(unittest.TestCase):
+    data = b"".join(
+        b"line %d: id=%d%s\n" % (i, i * 37, b" x" * (i % 5))
+        for i in range(300)
+    )
+
+    def sequential(self, r):
+        return [(m.start(), m.end(), m.group())
+                for m in r.as_bytes_re().finditer(self.data)]
+
+    def parallel(self, r, source, **kwargs):
+        return [(m.start, m.end, m.text)
+                for m in r.parallel_finditer(source, **kwargs)]
+
+    def test_bounded_pattern(self):
+        # Small chunks so that many matches straddle chunk boundaries
+        r = RE().literal("id=").between(1, 5).digits
+        expected = self.sequential(r)
+        self.assertEqual(len(expected), 300)
+        self.assertEqual(self.parallel(r, self.data, workers=1, chunk_size=7),
+                         expected)
+        self.assertEqual(self.parallel(r, self.data, workers=2, chunk_size=64),
+                         expected)
+
+    def test_unbounded_pattern(self):
+        r = RE().literal("id=").one_or_more.digit.zero_or_more.any_of(" x")
+        self.assertEqual(self.parallel(r, self.data, workers=1, chunk_size=50),
+                         self.sequential(r))
+
+    def test_file(self):
+        import tempfile
+        handle, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(self.data)
+            r = RE().word_boundary.one_or_more.digit.literal(":")
+            result = r.parallel_finditer(path, workers=2, chunk_size=100)
+            self.assertEqual([(m.start, m.end, m.text) for m in result],
+                             self.sequential(r))
+        finally:
+            os.remove(path)
+
+
+class ParallelBoundaryTests(unittest.TestCase):
+    def check(self, r, data, **kwargs):
+        expected = [(m.start(), m.end(), m.group())
+                    for m in r.as_bytes_re().finditer(data)]
+        self.assertEqual([(m.start, m.end, m.text)
+                          for m in r.parallel_finditer(data, **kwargs)],
+                         expected)
+
+    def test_chunk_starting_inside_match(self):
+        self.check(RE().exactly(3).literal("a"), b"aaaaaa",
+                   workers=1, chunk_size=2)
+        self.check(RE().between(1, 3).digit, b"12345",
+                   workers=1, chunk_size=2)
+
+    def test_random_boundaries(self):
+        import random
+        generator = random.Random(7)
+        words = [b"ab", b"abc12", b"x", b"12345678", b"a1b2c3d4e5"]
+        data = b" ".join(generator.choice(words) for _ in range(400))
+        r = RE().between(2, 8).alphanumeric
+        for _ in range(10):
+            chunk_size = generator.randint(1, 40)
+            self.check(r, data, workers=1, chunk_size=chunk_size)
+        self.check(r, data, workers=2, chunk_size=17)
+
+    def test_lookahead_at_chunk_end(self):
+        data = b"zz abcdef abcxyz abcdef"
+        r = RE().literal("abc").regex(b"(?=def)")
+        for chunk_size in range(1, 12):
+            self.check(r, data, workers=1, chunk_size=chunk_size)
+
+    def test_file_rewritten(self):
+        import tempfile
+        handle, path = tempfile.mkstemp()
+        r = RE().literal("abc")
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(b"abc\n")
+            self.assertEqual(len(list(r.parallel_finditer(path, workers=1))),
+                             1)
+            with open(path, 'wb') as f:
+                f.write(b"zzz abc abc\n")
+            self.assertEqual(
+                [m.start for m in r.parallel_finditer(path, workers=1)],
+                [4, 8]
+            )
+        finally:
+            os.remove(path)
+
+
+class LengthTests(unittest.TestCase):
+    def test_bounded(self):
+        r = (RE().start.literal("id").up_to(3).digits
+             .named_group("ext").between(2, 4).alpha.end_group)
+        self.assertEqual(r.min_length(), 4)
+        self.assertEqual(r.max_length(), 9)
+        self.assertEqual(RE().any_re("ab", RE().exactly(3).digit).max_length(),
+                         3)
+        self.assertEqual(RE().any_re("ab", RE().exactly(3).digit).min_length(),
+                         2)
+        self.assertEqual(RE().start.end.max_length(), 0)
+
+    def test_unbounded(self):
+        r = RE().literal("x").one_or_more.digit
+        self.assertEqual(r.min_length(), 2)
+        self.assertIsNone(r.max_length())
+        self.assertIsNone(RE().anything.max_length())
+
+
+class PrefilterTests(unittest.TestCase):
+    lines = ["ERROR: disk 3 full", "INFO: ok", "ERROR: bad", "DEBUG: x 2"]
+
+    def test_required_literals(self):
+        # A repeater applies to the last character of a literal, and
+        # any_re alternatives must be grouped to limit their scope
+        r = (RE().literal("ERROR: ").optional.literal("disk")
+             .group.any_re("a", "b").end_group
+             .one_or_more.digit.literal(" full"))
+        self.assertEqual(r.required_literals(), ["ERROR: dis", " full"])
+        self.assertEqual(RE().literal("x").any_re("a", "b")
+                         .required_literals(), [])
+        self.assertEqual(RE().zero_or_more.digit.required_literals(), [])
+
+    def test_search(self):
+        matcher = (RE().literal("ERROR: ").zero_or_more.alpha
+                   .literal(" ").one_or_more.digit).prefiltered()
+        self.assertEqual(matcher.literal, "ERROR: ")
+        results = [matcher.search(line) for line in self.lines]
+        self.assertEqual([bool(m) for m in results],
+                         [True, False, False, False])
+        stats = matcher.stats()
+        self.assertEqual((stats['calls'], stats['candidates'],
+                          stats['matches']), (4, 2, 1))
+        self.assertEqual(stats['selectivity'], 0.5)
+
+    def test_prefix_and_filter(self):
+        matcher = RE().start.literal("D").one_or_more.alpha.prefiltered()
+        self.assertEqual(matcher.prefix, "D")
+        self.assertEqual([m.group() for m in matcher.filter(self.lines)],
+                         ["DEBUG"])
+        self.assertEqual(matcher.stats()['candidates'], 1)
+
+    def test_ignorecase_and_bytes(self):
+        matcher = RE().literal("error").prefiltered(flags=re.IGNORECASE)
+        self.assertIsNone(matcher.literal)
+        self.assertTrue(matcher.search("ERROR"))
+        matcher = RE().literal("id=").digit.prefiltered(binary=True)
+        self.assertEqual(matcher.literal, b"id=")
+        self.assertTrue(matcher.search(b"an id=4"))
+
+
+class WordTests(unittest.TestCase):
+    def test_factoring(self):
+        self.assertEqual(RE().any_of_words(['foobar', 'foobaz', 'foo'])
+                         .as_string(), r"(?:foo(?:ba[rz])?)")
+        self.assertEqual(RE().any_of_words(['a', 'c', 'b']).as_string(),
+                         r"[abc]")
+        self.assertEqual(RE().any_of_words(['x.y', 'x-', 'z']).as_string(),
+                         r"(?:x(?:\.y|\-)|z)")
+        self.assertEqual(RE().digit.any_of_words([]).as_string(), r"\d")
+
+    def test_repeated(self):
+        r = RE().start.one_or_more.any_of_words(['ab', 'cd']).end
+        self.assertTrue(r.as_re().match("abcdab"))
+        self.assertFalse(r.as_re().match("abc"))
+
+    def test_equivalent_to_longest_first_alternation(self):
+        words = ['car', 'cart', 'carton', 'cat', 'do', 'dog', 'a.b', 'a']
+        text = "a cartons dog do a.b cat carts a+b dot"
+        flat = RE().any_re(*(RE().literal(w) for w in
+                             sorted(words, key=len, reverse=True)))
+        factored = RE().any_of_words(words)
+        self.assertEqual(factored.as_re().findall(text),
+                         flat.as_re().findall(text))
+
+
+class AnalyzeTests(unittest.TestCase):
+    def tearDown(self):
+        RE.strict = False
+
+    def test_nested_quantifier(self):
+        r = RE().start.one_or_more.regex(r"(\w+\s?)").end
+        self.assertEqual([w.kind for w in r.analyze()], ['nested_quantifier'])
+        # A separator that the inner repeat cannot match makes it safe
+        r = RE().one_or_more.regex(r"(\d{1,3}\.)")
+        self.assertEqual(r.analyze(), [])
+
+    def test_overlapping_alternatives(self):
+        r = RE().zero_or_more.regex(r"(?:\d|1x)")
+        self.assertEqual([w.kind for w in r.analyze()],
+                         ['overlapping_alternatives'])
+        self.assertEqual(RE().zero_or_more.regex(r"(?:\d|x1)").analyze(), [])
+
+    def test_documented_examples(self):
+        from grimace.analysis import backtracking_warnings
+        for pattern, kind in ((r"(a+)+", 'nested_quantifier'),
+                              (r"(\w+\s?)+", 'nested_quantifier'),
+                              (r"(?:\d|1x)*", 'overlapping_alternatives'),
+                              (r"(a|aa)*", 'overlapping_alternatives')):
+            self.assertEqual([w.kind for w in backtracking_warnings(pattern)],
+                             [kind], pattern)
+        self.assertEqual(backtracking_warnings(r"(a|ab)*"), [])
+
+    def test_disjoint_categories(self):
+        for pattern in (r"(\w+\s)+", r"^(?:\S+\s+)*end", r"(?:\d+\D)+"):
+            self.assertEqual(RE().regex(pattern).analyze(), [], pattern)
+        RE.strict = True
+        RE().one_or_more.regex(r"(\w+\s)").as_re()
+
+    def test_plain_patterns(self):
+        r = (RE().start.any_number_of.digits.dot.at_least_one.digit
+             .named_group("x").one_or_more.alpha.end_group.end)
+        self.assertEqual(r.analyze(), [])
+
+    def test_strict(self):
+        from grimace import BacktrackingError
+        r = RE().one_or_more.regex(r"(a+)").literal("b")
+        r.as_re()
+        RE.strict = True
+        # Already compiled, so remembered
+        r.as_re()
+        r = RE().one_or_more.regex(r"(a+)").literal("c")
+        with self.assertRaises(FormatError) as context:
+            r.as_re()
+        self.assertIsInstance(context.exception, BacktrackingError)
+        self.assertEqual(len(context.exception.warnings), 1)
+        RE().one_or_more.digit.as_re()
+
+
+class PossessiveTests(unittest.TestCase):
+    def test_markers(self):
+        from grimace import elements
+        if not elements.POSSESSIVE_SUPPORTED:
+            self.skipTest("needs Python 3.11")
+        self.assertEqual(RE().possessive_zero_or_more.digit.as_string(),
+                         r"\d*+")
+        self.assertEqual(RE().possessive_one_or_more.digit.as_string(),
+                         r"\d++")
+        self.assertEqual(RE().possessive_optional.digit.as_string(), r"\d?+")
+        self.assertEqual(RE().possessive_between(4, 2).digit.as_string(),
+                         r"\d{2,4}+")
+        r = RE().atomic_group.one_or_more.alpha.end_group.literal("x")
+        self.assertEqual(r.as_string(), r"(?>[a-zA-Z]+)x")
+        self.assertEqual(r.as_re().groups, 0)
+        # A possessive repeat does not give back the 'x' it consumed
+        self.assertIsNone(r.as_re().match("abx"))
+        self.assertIsNone(RE().possessive_one_or_more.alpha.literal("x")
+                          .as_re().match("abx"))
+        self.assertEqual(r.analyze(), [])
+
+    def test_fallback(self):
+        import warnings
+        from grimace import elements
+        saved = elements.POSSESSIVE_SUPPORTED
+        elements.POSSESSIVE_SUPPORTED = False
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                r = (RE().atomic_group.possessive_one_or_more.alpha
+                     .end_group.literal("x"))
+                self.assertEqual(r.as_string(), r"(?:[a-zA-Z]+)x")
+            self.assertTrue(caught)
+            self.assertTrue(all(issubclass(w.category, RuntimeWarning)
+                                for w in caught))
+        finally:
+            elements.POSSESSIVE_SUPPORTED = saved
+
+
+class InstrumentTests(unittest.TestCase):
+    def setUp(self):
+        self.saved_cache = RE.cache
+        RE.cache = PatternCache()
+        self.registry = instrument.enable()
+
+    def tearDown(self):
+        instrument.disable()
+        RE.cache = self.saved_cache
+
+    def test_records_use(self):
+        r = RE().one_or_more.digit
+        self.registry.label(r, 'digits')
+        compiled = r.as_re()
+        self.assertIs(r.as_re(), compiled)
+        self.assertEqual(compiled.groups, 0)
+        self.assertTrue(compiled.search("ab 12"))
+        self.assertFalse(compiled.match("ab 12"))
+        self.assertEqual(list(r.test_many(["1", "x", "2"])),
+                         [True, False, True])
+        self.assertEqual(len(list(compiled.finditer("1 2 3"))), 3)
+
+        stats = self.registry.as_dict()['digits']
+        self.assertEqual(stats['pattern'], r"\d+")
+        self.assertEqual(stats['compiles'], 1)
+        self.assertEqual(stats['calls'], 6)
+        self.assertEqual(stats['matches'], 4)
+        self.assertEqual(stats['misses'], 2)
+        self.assertGreaterEqual(stats['match_time'], 0)
+
+    def test_unlabelled_and_disabled(self):
+        RE().dot.as_bytes_re().search(b".")
+        self.assertEqual(self.registry.as_dict()[r"\."]['matches'], 1)
+        instrument.disable()
+        compiled = RE().dot.as_re()
+        self.assertNotIsInstance(compiled, instrument.InstrumentedPattern)
+        self.assertEqual(len(self.registry.as_dict()), 1)
+
+
+class LibraryTests(unittest.TestCase):
+    def setUp(self):
+        self.definitions = {
+            'number': RE().start.one_or_more.digit.end,
+            'pair': RE().named_group("key").one_or_more.alpha.end_group
+                        .literal('=').named_group("value")
+                        .one_or_more.digit.end_group,
+        }
+
+    def export(self, suffix):
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        export_library(self.definitions, path, flags={'pair': re.I})
+        return path
+
+    def check(self, library):
+        self.assertEqual(library.names(), ['number', 'pair'])
+        self.assertEqual(library.pattern('number'), r"^\d+$")
+        self.assertEqual(library.groupindex('pair'), {'key': 1, 'value': 2})
+        self.assertEqual(library.flags('pair'), re.I)
+        self.assertEqual(library.pair.match("AB=12").group("value"), "12")
+        self.assertIs(library['number'], library.compile('number'))
+        self.assertEqual(library.verify(self.definitions, {'pair': re.I}),
+                         [])
+
+    def test_json(self):
+        library = load_library(self.export('.json'))
+        self.assertEqual(len(library._compiled), 0)
+        self.check(library)
+
+    def test_module(self):
+        from grimace.library import _load_any
+        self.check(_load_any(self.export('.py')))
+
+    def test_verify(self):
+        library = build_library(self.definitions)
+        self.definitions['number'] = RE().start.one_or_more.alpha.end
+        self.definitions['extra'] = RE().dot
+        del self.definitions['pair']
+        self.assertEqual(library.verify(self.definitions),
+                         ['extra', 'number', 'pair'])
+        self.assertEqual(
+            build_library(self.definitions).verify(self.definitions), [])
+
+    def test_collect_module(self):
+        import types
+        module = types.ModuleType(str('patterns'))
+        module.word = RE().one_or_more.alpha
+        module._private = RE().dot
+        module.other = 3
+        self.assertEqual(build_library(module).names(), ['word'])
+        self.assertRaises(AttributeError, getattr, build_library(module),
+                          'missing')
+
+
+class BuilderTests(unittest.TestCase):
+    def test_same_vocabulary(self):
+        b = RE.builder()
+        self.assertIsInstance(b, REBuilder)
+        b.start.one_or_more.digit.then.literal('.').not_a.any_of('ab')
+        b.named_group('x').non_greedy.zero_or_more.alpha.end_group()
+        b.between(2, 3).whitespace.not_a.digit.end
+        expected = RE().start.one_or_more.digit.then.literal('.') \
+            .not_a.any_of('ab').named_group('x') \
+            .non_greedy.zero_or_more.alpha.end_group() \
+            .between(2, 3).whitespace.not_a.digit.end
+        self.assertEqual(str(b.freeze()), str(expected))
+
+    def test_loop(self):
+        b = RE.builder(RE().start)
+        for word in ('a.b', 'c'):
+            b.literal(word).optional.whitespace
+        self.assertEqual(b.freeze().as_string(), r"^a\.b\s?c\s?")
+
+    def test_freeze_is_independent(self):
+        b = REBuilder().digit
+        r = b.freeze()
+        b.dot
+        self.assertEqual(str(r), r"\d")
+        self.assertEqual(str(b.freeze()), r"\d\.")
+
+    def assertStepError(self, message, step):
+        try:
+            step(REBuilder())
+        except FormatError as e:
+            self.assertEqual(e.message, message)
+        else:
+            self.fail("No FormatError")
+
+    def test_step_errors(self):
+        self.assertStepError(
+            "Step 2 (end_group) has no matching start_group",
+            lambda b: b.digit.end_group)
+        self.assertStepError(
+            "Step 2 (group) cannot be repeated by step 1 (one_or_more); "
+            "put the repeat after the group is closed",
+            lambda b: b.one_or_more.group)
+        self.assertStepError(
+            "Step 2 (dot) has nothing that step 1 (not_a) can invert",
+            lambda b: b.not_a.dot)
+        self.assertStepError(
+            "Step 2 (literal) has nothing that step 1 (not_a) can invert",
+            lambda b: b.not_a.literal('x'))
+        self.assertStepError(
+            "Step 2 (optional) follows step 1 (one_or_more), which it "
+            "would override",
+            lambda b: b.one_or_more.optional)
+
+    def test_freeze_errors(self):
+        self.assertStepError(
+            "The group started at step 1 (group) is never ended",
+            lambda b: b.group.named_group('x').digit.end_group.freeze())
+        self.assertStepError(
+            "The expression cannot end with step 2 (one_or_more)",
+            lambda b: b.digit.one_or_more.freeze())
+
+    def test_failed_step_changes_nothing(self):
+        b = REBuilder().digit
+        self.assertRaises(FormatError, lambda: b.one_or_more.group)
+        self.assertEqual(str(b.then.digit.freeze()), r"\d\d+")
+        self.assertRaises(AttributeError, getattr, b, 'as_re')
+
+
+class CompactTests(unittest.TestCase):
+    def sample(self):
+        return RE().start.named_group('n').non_greedy.one_or_more.digit \
+            .end_group.not_a.any_of('ab').possessive_between(2, 3) \
+            .atomic_group.dot.end_group.group.literal('ab').end_group
+
+    def test_round_trip(self):
+        r = self.sample()
+        program = r.compact()
+        self.assertEqual(len(program), len(r.elements))
+        self.assertEqual(program.to_re().elements, r.elements)
+        self.assertEqual(str(program.to_re()), str(r))
+        self.assertEqual(program, RE(r.elements).compact())
+
+    def test_string_table(self):
+        program = RE().literal('ab').digit.literal('ab').digit.compact()
+        self.assertEqual(program.strings, ('ab', r"\d"))
+
+    def test_shared_elements(self):
+        a = RE().between(2, 7).digit.compact().to_re().elements
+        b = RE().between(7, 2).dot.compact().to_re().elements
+        self.assertIs(a[0], b[0])
+
+    def test_pickle(self):
+        import pickle
+        r = self.sample()
+        self.assertEqual(str(pickle.loads(pickle.dumps(r, 2))), str(r))
+        long_chain = RE()
+        for _ in range(5000):
+            long_chain = long_chain.digit
+        copy = pickle.loads(pickle.dumps(long_chain, 2))
+        self.assertEqual(copy.as_string(), r"\d" * 5000)
+
+
+class CharClassTests(unittest.TestCase):
+    def assertClass(self, charset, expected, members, outsiders):
+        self.assertEqual(RE().any_of(charset).as_string(), expected)
+        compiled = RE().start.any_of(charset).end.as_re()
+        for c in members:
+            self.assertIn(c, charset)
+            self.assertTrue(compiled.match(c), c)
+        for c in outsiders:
+            self.assertNotIn(c, charset)
+            self.assertFalse(compiled.match(c), c)
+
+    def test_ranges(self):
+        import string
+        self.assertEqual(
+            RE().any_of(string.ascii_letters + string.digits).as_string(),
+            "[0-9A-Za-z]")
+        self.assertEqual(RE().any_of("abba").as_string(), "[ab]")
+        self.assertEqual(RE().any_of("x").as_string(), "x")
+        self.assertEqual(RE().not_a.any_of("cab").as_string(), "[^a-c]")
+        self.assertEqual(
+            CharClass(ranges=[('a', 'f'), ('d', 'k')], chars='l').ranges,
+            ((ord('a'), ord('l')),))
+
+    def test_escaping(self):
+        self.assertClass(CharClass(RE.metacharacters),
+                         r"[\$\(-\+\-\.\?\[-\^\{-\}]",
+                         RE.metacharacters, ",/Z_")
+        self.assertClass(CharClass("\x00\t]"), r"[\x00\x09\]]",
+                         "\x00\t]", "\\ \n")
+
+    def test_algebra(self):
+        self.assertClass(CharClass.digit | CharClass('_-'), r"[\-_\d]",
+                         "7_-", "a ")
+        self.assertClass(CharClass.alpha - CharClass('aeiou'),
+                         "[A-Zb-df-hj-np-tv-z]", "bZ", "ae1")
+        self.assertClass(CharClass.alphanumeric & CharClass('a-z!'),
+                         "[az]", "az", "!b-")
+        self.assertClass(CharClass.alphanumeric - CharClass.digit,
+                         r"[^\W\d]", "a_", "1 -")
+        self.assertClass(CharClass.whitespace - CharClass('\n'),
+                         r"[^\x0a\S]", " \t", "\na")
+        self.assertClass(~CharClass('ab') | ~CharClass('bc'), "[^b]",
+                         "ac", "b")
+        self.assertClass(~CharClass.digit, r"\D", "a", "1")
+        self.assertEqual(str(RE().any_of(CharClass.digit |
+                                         CharClass.alphanumeric)), r"\w")
+
+    def test_not(self):
+        charset = CharClass.digit | CharClass('.')
+        self.assertEqual(RE().not_a.any_of(charset).as_string(), r"[^\.\d]")
+        self.assertEqual(RE().one_or_more(charset).as_string(), r"[\.\d]+")
+
+    def test_errors(self):
+        self.assertRaises(FormatError, str,
+                          RE().any_of(CharClass.alpha & CharClass.digit))
+        self.assertRaises(FormatError, CharClass, categories=['\\x'])
+        self.assertRaises(FormatError, lambda: CharClass.whitespace &
+                          ~(CharClass.digit | CharClass('x')))
+
+    def test_equality(self):
+        self.assertEqual(CharClass('ba'), CharClass(ranges=[('a', 'b')]))
+        self.assertIs(RE().any_of('ab').intern(),
+                      RE().any_of(CharClass('ba')).intern())
+
+
+class OptimizerTests(unittest.TestCase):
+    def test_rewrites(self):
+        for r, expected in (
+                (RE().digit.digit.digit, r"\d{3}"),
+                (RE().a.digit.then.one.dash, r"\d\-"),
+                (RE().exactly(3).digit.between(0, 1).dot, r"\d{3}\.?"),
+                (RE().literal("0000000000"), r"0{10}"),
+                (RE().any_re("foobar", "foobaz"), r"fooba(?:r|z)"),
+                (RE().group.any_re("foobar", "foobaz").end_group.digit,
+                 r"(fooba(?:r|z))\d"),
+                (RE().named_group("n").digit.digit.digit.end_group,
+                 r"(?P<n>\d{3})")):
+            self.assertEqual(r.optimized().as_string(), expected)
+
+    def test_left_alone(self):
+        for r in (RE().literal("x").any_re("foobar", "foobaz"),
+                  RE().regex("(?x) a a a a"),
+                  RE().regex("(").digit.digit.digit.regex(")"),
+                  RE().regex(r"(a)\1\1\1")):
+            self.assertEqual(r.optimized().as_string(), r.as_string())
+
+    def test_as_re(self):
+        r = RE().start.digit.digit.digit.end
+        compiled = r.as_re(optimize=True)
+        self.assertEqual(compiled.pattern, r"^\d{3}$")
+        self.assertIs(r.as_re(optimize=True), compiled)
+        self.assertEqual(r.as_re().pattern, r"^\d\d\d$")
+        self.assertEqual(r.as_re(re.VERBOSE, optimize=True).pattern,
+                         r"^\d\d\d$")
+
+    def random_re(self, generator, depth=0):
+        """
+        Returns:
+            RE: a random RE built from the fluent vocabulary
+        """
+        r = RE()
+        for _ in range(generator.randint(1, 6)):
+            choice = generator.randint(0, 9)
+            if choice < 3:
+                r = r.exactly(generator.randint(1, 3)) if choice == 0 else \
+                    r.one if choice == 1 else r.optional
+            if choice == 3 and depth < 2:
+                r = r.group(self.random_re(generator, depth + 1)).end_group
+            elif choice == 4:
+                words = ["ab" + generator.choice(["a", "b.", "c"])
+                         for _ in range(generator.randint(2, 3))]
+                r = r.group.any_re(*words).end_group
+            elif choice == 5:
+                r = r.any_of(generator.choice(["ab", "a.", "1b"]))
+            else:
+                r = generator.choice([r.digit, r.alpha, r.dot,
+                                      r.literal("a"), r.literal("aaaa"),
+                                      r.not_a.digit])
+        return r
+
+    def test_differential(self):
+        import random
+        generator = random.Random(7)
+        subjects = [''.join(generator.choice("aab.1c ")
+                            for _ in range(generator.randint(0, 14)))
+                    for _ in range(60)]
+        for _ in range(300):
+            r = self.random_re(generator)
+            plain, optimized = r.as_re(), r.as_re(optimize=True)
+            self.assertLessEqual(len(optimized.pattern), len(plain.pattern))
+            self.assertEqual(plain.groups, optimized.groups)
+            for subject in subjects:
+                self.assertEqual(
+                    [(m.span(), m.groups()) for m in plain.finditer(subject)],
+                    [(m.span(), m.groups())
+                     for m in optimized.finditer(subject)],
+                    (plain.pattern, optimized.pattern, subject))
+
+
+@unittest.skipIf(sys.version_info < (3, 6), "needs async generators")
+class AsyncTests(unittest.TestCase):
+    def setUp(self):
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(asyncio.set_event_loop, None)
+
+    def reader(self, data):
+        import asyncio
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return reader
+
+    def collect(self, results):
+        collected = []
+        while True:
+            try:
+                collected.append(
+                    self.loop.run_until_complete(results.__anext__()))
+            except StopAsyncIteration:
+                return collected
+
+    def test_match_stream(self):
+        r = RE().literal(b"id=").group.one_or_more.digit.end_group
+        lines = b"id=1\nnothing\nx id=22\nid=3 id=4\n"
+        found = self.collect(r.amatch_stream(self.reader(lines)))
+        self.assertEqual([m.group(1) for m in found], [b"1", b"22", b"3"])
+        found = self.collect(r.amatch_stream(self.reader(lines),
+                                             search=False))
+        self.assertEqual([m.group(1) for m in found], [b"1", b"3"])
+
+    def test_finditer(self):
+        import asyncio
+
+        class Source(object):
+            def __init__(self, items):
+                self.items = iter(items)
+
+            def __aiter__(self):
+                return self
+
+            def __anext__(self):
+                future = asyncio.Future()
+                try:
+                    future.set_result(next(self.items))
+                except StopIteration:
+                    future.set_exception(StopAsyncIteration())
+                return future
+
+        r = RE().one_or_more.digit
+        items = ["a1b22", "", "333 4", "x" * 50 + "55"]
+        found = self.collect(r.afinditer(Source(items),
+                                         executor_threshold=20))
+        self.assertEqual([m.group() for m in found],
+                         ["1", "22", "333", "4", "55"])
+
+    def test_yields_control(self):
+        ticks = []
+
+        def tick():
+            ticks.append(1)
+            if len(ticks) < 1000:
+                self.loop.call_soon(tick)
+
+        self.loop.call_soon(tick)
+        r = RE().literal(b"never")
+        self.collect(r.amatch_stream(self.reader(b"line\n" * 100),
+                                     batch_size=10))
+        self.assertGreaterEqual(len(ticks), 10)
+
+
+class StreamTests(unittest.TestCase):
+    def expected(self, r, text, flags=0):
+        compiled = r.as_bytes_re(flags) if isinstance(text, bytes) \
+            else r.as_re(flags)
+        return [(m.start(), m.end(), m.group(), m.groups())
+                for m in compiled.finditer(text)]
+
+    def fed(self, r, text, size, flags=0, limit=64):
+        matcher = r.stream_matcher(flags, limit=limit)
+        found = []
+        for i in range(0, len(text), size):
+            found.extend(matcher.feed(text[i:i + size]))
+        found.extend(matcher.close())
+        return [tuple(m) for m in found]
+
+    def test_same_as_finditer(self):
+        patterns = [
+            RE().one.digit.literal('-').group.between(2, 3).digit.end_group,
+            RE().word_boundary.exactly(3).alpha.word_boundary,
+            RE().zero_or_more.literal('a'),
+            RE().start.literal('ab'),
+            RE().literal('x').end,
+            RE(r'foo(?=bar)'),
+            RE(r'(?<=<)').one.alpha,
+            RE().any_re(RE().literal('abc'), RE().literal('b')),
+        ]
+        text = 'abc 12-345 foo foobar <x> aaa 9-99 ab\nxyzx'
+        for r in patterns:
+            for size in (1, 2, 3, 7, len(text)):
+                self.assertEqual(self.fed(r, text, size),
+                                 self.expected(r, text), (str(r), size))
+                data = text.encode('ascii')
+                self.assertEqual(self.fed(r, data, size),
+                                 self.expected(r, data), (str(r), size))
+
+    def test_empty_stream(self):
+        r = RE().zero_or_more.literal('a')
+        self.assertEqual(self.fed(r, '', 1), [(0, 0, '', ())])
+
+    def test_bounded_memory(self):
+        r = RE().literal('id=').group.exactly(4).digit.end_group
+        matcher = r.stream_matcher()
+        found = []
+        for i in range(2000):
+            found.extend(matcher.feed('xx id=%04d yy ' % i))
+            self.assertLess(len(matcher._buffer), 40)
+        found.extend(matcher.close())
+        self.assertEqual(len(found), 2000)
+        self.assertEqual(found[-1].groups, ('1999',))
+
+    def test_unbounded_limit(self):
+        r = RE().one_or_more.digit
+        text = 'ab 123 ' + '9' * 100 + ' 45'
+        self.assertEqual(self.fed(r, text, 5, limit=1000),
+                         self.expected(r, text))
+        matcher = r.stream_matcher(limit=10)
+        found = []
+        for i in range(0, len(text), 5):
+            found.extend(matcher.feed(text[i:i + 5]))
+            self.assertLess(len(matcher._buffer), 30)
+        found.extend(matcher.close())
+        self.assertEqual(''.join(m.text for m in found[1:-1]), '9' * 100)
+        self.assertEqual(found[-1].text, '45')
+
+    def test_feed_after_close(self):
+        matcher = RE().literal('a').stream_matcher()
+        matcher.feed('a')
+        matcher.close()
+        self.assertRaises(ValueError, matcher.feed, 'a')
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Building factored alternations from lists of literal words.
+"""
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+# The key that marks the end of a word in a trie node.  No character is
+# the empty string, so it cannot collide with a child.
+_END = ''
+
+
+def build_trie(words):
+    """
+    Returns:
+        dict: a trie of the words, in which each node maps a character to
+            a child node, and holds _END if a word ends there
+    """
+    root = {}
+    for word in words:
+        node = root
+        for c in word:
+            node = node.setdefault(c, {})
+        node[_END] = True
+    return root
+
+
+def _node_pattern(node, escape):
+    """
+    Returns:
+        str: the pattern for the words below node, or None if no word
+            continues below it
+    """
+    alternatives = []
+    characters = []
+    for c in sorted(k for k in node if k != _END):
+        rest = _node_pattern(node[c], escape)
+        if rest is None:
+            characters.append(escape(c))
+        else:
+            alternatives.append(escape(c) + rest)
+
+    # Single characters that end a word are collected into one class
+    if len(characters) == 1:
+        alternatives.append(characters[0])
+    elif characters:
+        alternatives.append('[%s]' % ''.join(characters))
+
+    if not alternatives:
+        return None
+
+    if len(alternatives) == 1:
+        pattern = alternatives[0]
+        # A lone character or class can take a repeat marker directly
+        atomic = bool(characters)
+    else:
+        pattern = '(?:%s)' % '|'.join(alternatives)
+        atomic = True
+
+    if _END in node:
+        # A word also ends here, so what follows is optional.  The
+        # optional part is greedy, so the longest word is preferred.
+        return pattern + '?' if atomic else '(?:%s)?' % pattern
+    return pattern
+
+
+def trie_pattern(words, escape):
+    """
+    Build a regexp that matches any of the words, factored by common
+    prefixes, e.g. ['foobar', 'foobaz', 'foo'] gives 'foo(?:ba[rz])?'.
+    At any position it matches the longest of the words that it can.
+
+    Args:
+        words (iterable): the literal words
+        escape (callable): escapes a single character
+    Returns:
+        str: the pattern, or None if there are no words
+    """
+    root = build_trie(words)
+    if not root:
+        return None
+    pattern = _node_pattern(root, escape)
+    return pattern if pattern is not None else ''
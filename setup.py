@@ -55,7 +55,7 @@ setup(
     ],
     keywords=['re', 'regex', 'regexp', 'regular expression', 'fluent'],
     install_requires=['nine'],
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     zip_safe=False,
     test_suite='grimace.tests',